@@ -0,0 +1,123 @@
+# backup.py
+# نسخ احتياطي حيّ لقاعدة البيانات عبر واجهة SQLite backup دون إيقاف البوت
+#
+#   python backup.py backup            إنشاء نسخة جديدة وتدوير القديمة
+#   python backup.py list              عرض النسخ المتوفرة
+#   python backup.py verify <file>     فحص سلامة نسخة
+#   python backup.py restore <file>    استعادة نسخة (أوقف البوت أولاً)
+import sqlite3
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+import config
+
+BACKUP_PREFIX = "contest_"
+BACKUP_SUFFIX = ".db.gz"
+STEP_SLEEP = 0.005
+
+def list_backups(backup_dir=config.BACKUP_DIR):
+    if not os.path.isdir(backup_dir):
+        return []
+    names = sorted(n for n in os.listdir(backup_dir) if n.startswith(BACKUP_PREFIX) and n.endswith(BACKUP_SUFFIX))
+    return [os.path.join(backup_dir, n) for n in names]
+
+# keep < 1 يعني الاحتفاظ بكل النسخ
+def rotate_backups(backup_dir=config.BACKUP_DIR, keep=config.BACKUP_KEEP):
+    if keep < 1:
+        return
+    for path in list_backups(backup_dir)[:-keep]:
+        os.remove(path)
+
+# تنسخ بضع صفحات في كل خطوة من اتصال قراءة مستقل. المعاملة المفتوحة على المصدر
+# تثبّت لقطة WAL متسقة، فلا تُعاد النسخة من البداية عند كتابة البوت أثناءها.
+def create_backup(db_path=config.DB_PATH, backup_dir=config.BACKUP_DIR,
+                  pages=config.BACKUP_PAGES_PER_STEP, keep=config.BACKUP_KEEP):
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    final_path = os.path.join(backup_dir, f"{BACKUP_PREFIX}{stamp}{BACKUP_SUFFIX}")
+    fd, raw_path = tempfile.mkstemp(dir=backup_dir, suffix=".db.part")
+    os.close(fd)
+    try:
+        src = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, isolation_level=None)
+        dst = sqlite3.connect(raw_path)
+        try:
+            src.execute("BEGIN")
+            src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            src.backup(dst, pages=pages, sleep=STEP_SLEEP)
+            src.execute("COMMIT")
+        finally:
+            dst.close()
+            src.close()
+        with open(raw_path, 'rb') as f_in, gzip.open(final_path + ".part", 'wb', compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.replace(final_path + ".part", final_path)
+    finally:
+        for p in (raw_path, final_path + ".part"):
+            if os.path.exists(p):
+                os.remove(p)
+    rotate_backups(backup_dir, keep)
+    return final_path
+
+def decompress_to(path, target):
+    with gzip.open(path, 'rb') as f_in, open(target, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+
+# يعيد (سليمة؟، رسالة)
+def verify_backup(path):
+    fd, tmp = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        decompress_to(path, tmp)
+        conn = sqlite3.connect(f"file:{tmp}?mode=ro", uri=True)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            if result != "ok":
+                return False, result
+            users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            contests = conn.execute("SELECT COUNT(*) FROM contests").fetchone()[0]
+            return True, f"ok — users: {users}, contests: {contests}"
+        finally:
+            conn.close()
+    except (OSError, sqlite3.DatabaseError) as e:
+        return False, str(e)
+    finally:
+        os.remove(tmp)
+
+def restore_backup(path, db_path=config.DB_PATH):
+    ok, msg = verify_backup(path)
+    if not ok:
+        raise ValueError(f"النسخة تالفة: {msg}")
+    tmp = db_path + ".restore"
+    decompress_to(path, tmp)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.replace(tmp, db_path)
+    return msg
+
+def main(argv):
+    if not argv or argv[0] not in ("backup", "list", "verify", "restore"):
+        print("usage: python backup.py backup|list|verify <file>|restore <file>")
+        return 2
+    cmd = argv[0]
+    if cmd == "backup":
+        print(create_backup())
+    elif cmd == "list":
+        for path in list_backups():
+            print(f"{path}\t{os.path.getsize(path)}")
+    elif len(argv) < 2:
+        print(f"usage: python backup.py {cmd} <file>")
+        return 2
+    elif cmd == "verify":
+        ok, msg = verify_backup(argv[1])
+        print(msg)
+        return 0 if ok else 1
+    else:
+        print(restore_backup(argv[1]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,90 @@
+# benchmarks/bench_backup.py
+# يقيس زمن الكتابة (مثل award_points) على قاعدة كبيرة بدون نسخ احتياطي ومع نسخ حيّ متزامن
+#
+#   python benchmarks/bench_backup.py --size-gb 2 --workdir /tmp/bench_backup
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import backup
+
+def build_database(path, size_gb):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, points INTEGER DEFAULT 0, pad BLOB)")
+    conn.execute("CREATE TABLE IF NOT EXISTS contests (id INTEGER PRIMARY KEY)")
+    target = int(size_gb * 1024 ** 3)
+    batch = 100_000
+    while os.path.getsize(path) < target:
+        start = conn.execute("SELECT COALESCE(MAX(user_id), 0) FROM users").fetchone()[0]
+        conn.execute("""WITH RECURSIVE c(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM c WHERE i < ?)
+                        INSERT INTO users (user_id, pad) SELECT ? + i, randomblob(1000) FROM c""", (batch, start))
+        conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    total = conn.execute("SELECT MAX(user_id) FROM users").fetchone()[0]
+    conn.close()
+    return total
+
+def measure_writes(path, total_users, stop):
+    conn = sqlite3.connect(path)
+    latencies = []
+    i = 0
+    while not stop.is_set():
+        uid = (i * 7919) % total_users + 1
+        t0 = time.perf_counter()
+        conn.execute("UPDATE users SET points = points + 5 WHERE user_id = ?", (uid,))
+        conn.commit()
+        latencies.append(time.perf_counter() - t0)
+        i += 1
+        time.sleep(0.001)
+    conn.close()
+    return latencies
+
+def summarize(name, latencies):
+    latencies = sorted(latencies)
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"{name:<18} n={len(latencies):<7} p50={p(0.5):.3f}ms p99={p(0.99):.3f}ms "
+          f"max={latencies[-1] * 1000:.3f}ms mean={statistics.mean(latencies) * 1000:.3f}ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-gb", type=float, default=2.0)
+    parser.add_argument("--workdir", default="/tmp/bench_backup")
+    parser.add_argument("--baseline-seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    db_path = os.path.join(args.workdir, "contest.db")
+    backup_dir = os.path.join(args.workdir, "backups")
+    t0 = time.perf_counter()
+    total = build_database(db_path, args.size_gb)
+    print(f"database: {os.path.getsize(db_path) / 1024 ** 3:.2f} GB, {total} users "
+          f"(built in {time.perf_counter() - t0:.1f}s)")
+
+    stop = threading.Event()
+    timer = threading.Timer(args.baseline_seconds, stop.set)
+    timer.start()
+    summarize("no backup", measure_writes(db_path, total, stop))
+
+    stop = threading.Event()
+    result = {}
+    def run_backup():
+        t = time.perf_counter()
+        result['path'] = backup.create_backup(db_path, backup_dir, keep=1)
+        result['seconds'] = time.perf_counter() - t
+        stop.set()
+    worker = threading.Thread(target=run_backup)
+    worker.start()
+    summarize("during backup", measure_writes(db_path, total, stop))
+    worker.join()
+    print(f"backup: {result['path']} ({os.path.getsize(result['path']) / 1024 ** 2:.1f} MB) "
+          f"in {result['seconds']:.1f}s")
+    print("verify:", backup.verify_backup(result['path'])[1])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/bench_bitmaps.py
+# يقارن الذاكرة وزمن الفحص بين set عادي و RoaringBitmap لمجموعات معرفات مستخدمين كبيرة
+#
+#   python benchmarks/bench_bitmaps.py --count 10000000
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bitmaps import RoaringBitmap
+
+# يُبنى الكائن مرتين: مرة للتوقيت، ومرة تحت tracemalloc للذاكرة (tracemalloc يبطئ البناء كثيرًا)
+def measure(label, build):
+    t0 = time.perf_counter()
+    obj = build()
+    elapsed = time.perf_counter() - t0
+    del obj
+    tracemalloc.start()
+    obj = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} build={elapsed:6.2f}s  memory={current / 1024 ** 2:8.1f} MB")
+    return obj
+
+def time_lookups(label, container, probes):
+    t0 = time.perf_counter()
+    hits = sum(1 for p in probes if p in container)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<22} {len(probes)} lookups in {elapsed * 1000:.1f} ms ({hits} hits)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=10_000_000)
+    parser.add_argument("--max-id", type=int, default=8_000_000_000, help="أكبر معرف (معرفات Telegram تصل إلى ~8e9)")
+    parser.add_argument("--dense", action="store_true", help="معرفات متتالية بدل العشوائية")
+    args = parser.parse_args()
+
+    random.seed(42)
+    if args.dense:
+        ids = list(range(1, args.count + 1))
+    else:
+        ids = sorted(set(random.randrange(1, args.max_id) for _ in range(args.count)))
+    print(f"{len(ids)} ids")
+
+    s = measure("set", lambda: set(ids))
+    bm = measure("RoaringBitmap", lambda: RoaringBitmap.from_sorted(ids))
+    print(f"RoaringBitmap payload  {bm.memory_bytes() / 1024 ** 2:8.1f} MB")
+
+    probes = [random.choice(ids) if i % 2 else random.randrange(1, args.max_id) for i in range(1_000_000)]
+    time_lookups("set", s, probes)
+    time_lookups("RoaringBitmap", bm, probes)
+
+    banned = RoaringBitmap.from_sorted(ids[::100])
+    t0 = time.perf_counter()
+    recipients = bm - banned
+    print(f"difference (1% banned) {time.perf_counter() - t0:.2f}s -> {len(recipients)} recipients")
+
+if __name__ == "__main__":
+    main()
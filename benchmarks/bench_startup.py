@@ -0,0 +1,83 @@
+# benchmarks/bench_startup.py
+# يقيس الزمن من بدء العملية حتى أول رد ممكن (فحص الحظر + قراءة المستخدم كما في /start)،
+# مع التحميل المسبق المتزامن للمجموعات (السلوك السابق) ومع التحميل الكسول في الخلفية.
+# كل قياس في عملية جديدة حتى يشمل الاستيراد وفتح قاعدة البيانات.
+#
+#   python benchmarks/bench_startup.py --users 2000000 --workdir /tmp/bench_startup
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import bot
+imported = time.perf_counter()
+bot.build_application("123456:bench")
+built = time.perf_counter()
+if sys.argv[2] == "eager":
+    bot.load_user_bitmaps()
+uid = int(sys.argv[3])
+banned = uid in bot.banned_users
+user = bot.get_user_data(uid)
+first = time.perf_counter()
+asyncio.run(bot.warm_caches())
+warm = time.perf_counter()
+print(json.dumps({"import": imported - t0, "build": built - imported, "first_response": first - t0,
+                  "warm": warm - t0}))
+"""
+
+def build_database(workdir, users):
+    db_path = os.path.join(workdir, "contest.db")
+    if os.path.exists(db_path):
+        return db_path
+    code = (
+        "import random, sys\n"
+        f"sys.path.insert(0, {ROOT!r})\n"
+        "import bot\n"
+        "conn = bot.open_database()\n"
+        "rng = random.Random(3)\n"
+        f"rows = ((1_000_000_000 + i * 7, 'u', 'f', int(rng.random() < 0.02), int(rng.random() < 0.6)) for i in range({users}))\n"
+        "conn.executemany('INSERT INTO users (user_id, username, full_name, banned, has_verified) VALUES (?, ?, ?, ?, ?)', rows)\n"
+        "conn.commit()\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=workdir, env={**os.environ, "DB_PATH": db_path})
+    return db_path
+
+def run_child(workdir, db_path, mode, uid):
+    out = subprocess.run([sys.executable, "-c", CHILD, ROOT, mode, str(uid)], check=True, cwd=workdir,
+                         capture_output=True, text=True, env={**os.environ, "DB_PATH": db_path})
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workdir", default="/tmp/bench_startup")
+    args = parser.parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    db_path = build_database(args.workdir, args.users)
+    print(f"{args.users} users ({os.path.getsize(db_path) / 1024 ** 2:.0f} MB, ready in {time.perf_counter() - t0:.1f}s)")
+    # أول تشغيل بعد الإنشاء يضبط user_version؛ لا يدخل في القياس
+    run_child(args.workdir, db_path, "lazy", 1_000_000_000)
+
+    rng = random.Random(5)
+    for mode in ("eager", "lazy"):
+        runs = [run_child(args.workdir, db_path, mode, 1_000_000_000 + rng.randrange(args.users) * 7)
+                for _ in range(args.runs)]
+        med = lambda key: statistics.median(r[key] for r in runs) * 1000
+        print(f"{mode:<6} import={med('import'):7.1f}ms  build={med('build'):7.1f}ms  "
+              f"first response={med('first_response'):8.1f}ms  caches warm={med('warm'):8.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# bitmaps.py
+# مجموعات أعداد صحيحة مضغوطة على طريقة Roaring: تُقسَّم المعرفات حسب الـ 16 بت العليا،
+# وكل قطعة إما مصفوفة مرتبة (uint16) إن كانت متفرقة، أو خريطة بتات 8KB إن كانت كثيفة.
+from array import array
+from bisect import bisect_left
+
+ARRAY_MAX = 4096
+BITMAP_BYTES = 1 << 13
+
+def _to_bitmap(values):
+    bits = bytearray(BITMAP_BYTES)
+    for v in values:
+        bits[v >> 3] |= 1 << (v & 7)
+    return bits
+
+def _iter_bitmap(bits):
+    for i, byte in enumerate(bits):
+        if byte:
+            base = i << 3
+            for j in range(8):
+                if byte & (1 << j):
+                    yield base + j
+
+class RoaringBitmap:
+    __slots__ = ('_chunks', '_counts', '_size')
+
+    def __init__(self, values=()):
+        self._chunks = {}
+        # عدد العناصر في كل قطعة من نوع خريطة البتات (للتحويل إلى مصفوفة دون إعادة العد)
+        self._counts = {}
+        self._size = 0
+        self.update(values)
+
+    @classmethod
+    def from_sorted(cls, values):
+        # المدخلات مرتبة تصاعديًا بلا تكرار (مثل مفتاح أساسي من قاعدة البيانات)
+        bm = cls()
+        current, lows = None, array('H')
+        for v in values:
+            high = v >> 16
+            if high != current:
+                if lows:
+                    bm._set_chunk(current, lows)
+                    bm._size += len(lows)
+                current, lows = high, array('H')
+            lows.append(v & 0xFFFF)
+        if lows:
+            bm._set_chunk(current, lows)
+            bm._size += len(lows)
+        return bm
+
+    def __contains__(self, value):
+        chunk = self._chunks.get(value >> 16)
+        if chunk is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(chunk, bytearray):
+            return bool(chunk[low >> 3] & (1 << (low & 7)))
+        i = bisect_left(chunk, low)
+        return i < len(chunk) and chunk[i] == low
+
+    def add(self, value):
+        high, low = value >> 16, value & 0xFFFF
+        chunk = self._chunks.get(high)
+        if chunk is None:
+            self._chunks[high] = array('H', (low,))
+            self._size += 1
+        elif isinstance(chunk, bytearray):
+            mask = 1 << (low & 7)
+            if not chunk[low >> 3] & mask:
+                chunk[low >> 3] |= mask
+                self._counts[high] += 1
+                self._size += 1
+        else:
+            i = bisect_left(chunk, low)
+            if i < len(chunk) and chunk[i] == low:
+                return
+            chunk.insert(i, low)
+            self._size += 1
+            if len(chunk) > ARRAY_MAX:
+                self._set_chunk(high, chunk)
+
+    def discard(self, value):
+        high, low = value >> 16, value & 0xFFFF
+        chunk = self._chunks.get(high)
+        if chunk is None:
+            return
+        if isinstance(chunk, bytearray):
+            mask = 1 << (low & 7)
+            if not chunk[low >> 3] & mask:
+                return
+            chunk[low >> 3] &= ~mask & 0xFF
+            self._counts[high] -= 1
+            self._size -= 1
+            if self._counts[high] <= ARRAY_MAX:
+                self._set_chunk(high, array('H', _iter_bitmap(chunk)))
+        else:
+            i = bisect_left(chunk, low)
+            if i == len(chunk) or chunk[i] != low:
+                return
+            del chunk[i]
+            self._size -= 1
+        if not self._chunks[high]:
+            del self._chunks[high]
+
+    def update(self, values):
+        for v in values:
+            self.add(v)
+
+    def difference_update(self, values):
+        for v in values:
+            self.discard(v)
+
+    def _set_chunk(self, high, lows):
+        if len(lows) > ARRAY_MAX:
+            self._chunks[high] = _to_bitmap(lows)
+            self._counts[high] = len(lows)
+        else:
+            self._chunks[high] = lows if isinstance(lows, array) else array('H', lows)
+            self._counts.pop(high, None)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for high in sorted(self._chunks):
+            chunk = self._chunks[high]
+            base = high << 16
+            lows = _iter_bitmap(chunk) if isinstance(chunk, bytearray) else chunk
+            for low in lows:
+                yield base | low
+
+    def _combine(self, other, op):
+        result = RoaringBitmap()
+        highs = self._chunks.keys() | other._chunks.keys() if op == 'or' else self._chunks.keys()
+        for high in highs:
+            a = self._chunks.get(high)
+            b = other._chunks.get(high)
+            if op == 'and' and b is None:
+                continue
+            sa = set(_iter_bitmap(a) if isinstance(a, bytearray) else a or ())
+            sb = set(_iter_bitmap(b) if isinstance(b, bytearray) else b or ())
+            lows = sa | sb if op == 'or' else sa & sb if op == 'and' else sa - sb
+            if lows:
+                result._set_chunk(high, sorted(lows))
+                result._size += len(lows)
+        return result
+
+    def __or__(self, other):
+        return self._combine(other, 'or')
+
+    def __and__(self, other):
+        return self._combine(other, 'and')
+
+    def __sub__(self, other):
+        return self._combine(other, 'sub')
+
+    def memory_bytes(self):
+        total = 0
+        for chunk in self._chunks.values():
+            total += BITMAP_BYTES if isinstance(chunk, bytearray) else chunk.itemsize * len(chunk)
+        return total
@@ -2,13 +2,40 @@
 import sqlite3
 import logging
 import random
-from datetime import datetime, timedelta
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+import time
+import re
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta, time as dt_time
 import config
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from bitmaps import RoaringBitmap
+import backup
+import profiling
+import recorder
+import retention
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent
+)
+from telegram.error import BadRequest, Forbidden, RetryAfter
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
+    ChatMemberHandler,
+    InlineQueryHandler,
+    TypeHandler,
+    ApplicationHandlerStop,
     MessageHandler,
     ContextTypes,
     filters
@@ -22,15 +49,110 @@ CHANNEL_USERNAME = config.CHANNEL_USERNAME
 BOT_USERNAME = config.BOT_USERNAME
 POINTS_PER_REFERRAL = config.POINTS_PER_REFERRAL
 MAX_JOIN_ATTEMPTS = config.MAX_JOIN_ATTEMPTS
+STATS_RECONCILE_HOUR = config.STATS_RECONCILE_HOUR
+POINTS_REPAIR_HOUR = config.POINTS_REPAIR_HOUR
+POINTS_REPAIR_CHUNK = config.POINTS_REPAIR_CHUNK
+JOIN_WINDOW_SECONDS = config.JOIN_WINDOW_SECONDS
+JOIN_EVENT_BUFFER = max(config.JOIN_EVENT_BUFFER, 2 * (MAX_JOIN_ATTEMPTS + 1))
+JOIN_TRACKER_MAX_USERS = config.JOIN_TRACKER_MAX_USERS
+JOIN_FLUSH_SECONDS = config.JOIN_FLUSH_SECONDS
+BULK_CHUNK_SIZE = config.BULK_CHUNK_SIZE
+DROP_PENDING_UPDATES = config.DROP_PENDING_UPDATES
+UPDATE_DEDUP_MEMORY = config.UPDATE_DEDUP_MEMORY
+UPDATE_DEDUP_FLUSH_SECONDS = config.UPDATE_DEDUP_FLUSH_SECONDS
+IDEMPOTENCY_WINDOW_SECONDS = config.IDEMPOTENCY_WINDOW_SECONDS
+PROFILE_SECONDS = config.PROFILE_SECONDS
+CONTEST_PAGE_SIZE = config.CONTEST_PAGE_SIZE
+SWEEP_INTERVAL_MINUTES = config.SWEEP_INTERVAL_MINUTES
+SWEEP_BATCH_SIZE = config.SWEEP_BATCH_SIZE
+SWEEP_BATCHES_PER_RUN = config.SWEEP_BATCHES_PER_RUN
+SWEEP_CONCURRENCY = config.SWEEP_CONCURRENCY
+SWEEP_RATE_PER_SECOND = config.SWEEP_RATE_PER_SECOND
+RETENTION_INTERVAL_MINUTES = config.RETENTION_INTERVAL_MINUTES
+RETENTION_IDLE_SECONDS = config.RETENTION_IDLE_SECONDS
+RETENTION_BUDGET_SECONDS = config.RETENTION_BUDGET_SECONDS
+LEADERBOARD_PAGE_SIZE = config.LEADERBOARD_PAGE_SIZE
+LEADERBOARD_MAX_PAGES = config.LEADERBOARD_MAX_PAGES
+LEADERBOARD_CACHE_SECONDS = config.LEADERBOARD_CACHE_SECONDS
+OUTBOX_BATCH_SIZE = config.OUTBOX_BATCH_SIZE
+OUTBOX_POLL_SECONDS = config.OUTBOX_POLL_SECONDS
+OUTBOX_MAX_ATTEMPTS = config.OUTBOX_MAX_ATTEMPTS
+REFERRAL_DIGEST_MIN_SECONDS = config.REFERRAL_DIGEST_MIN_SECONDS
+REFERRAL_DIGEST_MAX_SECONDS = config.REFERRAL_DIGEST_MAX_SECONDS
+REFERRAL_DIGEST_TRACKED = config.REFERRAL_DIGEST_TRACKED
+RECENT_VERIFIED_DAYS = config.RECENT_VERIFIED_DAYS
+INLINE_CACHE_SECONDS = config.INLINE_CACHE_SECONDS
+INLINE_TOP_COUNT = config.INLINE_TOP_COUNT
+INLINE_CACHE_USERS = config.INLINE_CACHE_USERS
+DB_PATH = config.DB_PATH
+ARCHIVE_DIR = config.ARCHIVE_DIR
+BACKUP_DIR = config.BACKUP_DIR
+BACKUP_KEEP = config.BACKUP_KEEP
+BACKUP_PAGES_PER_STEP = config.BACKUP_PAGES_PER_STEP
 
 CHANNEL_ID = f"@{CHANNEL_USERNAME}"
 CHANNEL_LINK = f"https://t.me/{CHANNEL_USERNAME}"
 
+# === العرض: لوحات مفاتيح ثابتة، نصوص مخزنة، وتخطي التعديل غير الضروري ===
+# InlineKeyboardMarkup غير قابل للتعديل في python-telegram-bot 20، فتُبنى اللوحات الثابتة مرة واحدة وتُشارك
+_back_keyboards = {}
+
+def back_keyboard(target, label="🔙 رجوع"):
+    key = (target, label)
+    if key not in _back_keyboards:
+        _back_keyboards[key] = InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data=target)]])
+    return _back_keyboards[key]
+
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🏆 المسابقات الحالية", callback_data="view_active_contests")],
+    [InlineKeyboardButton("👤 ملفي", callback_data="view_profile"),
+     InlineKeyboardButton("🏅 لوحة الصدارة", callback_data="leaderboard_1")],
+    [InlineKeyboardButton("🛠️ الدعم الفني", callback_data="support"),
+     InlineKeyboardButton("💎 تجميع النقاط", callback_data="earn_points")]
+])
+ADMIN_PANEL_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📢 إدارة المسابقات", callback_data="manage_contests")],
+    [InlineKeyboardButton("📊 الإحصائيات", callback_data="view_statistics"),
+     InlineKeyboardButton("📤 تصدير البيانات", callback_data="export_menu")],
+    [InlineKeyboardButton("🛡️ مكافحة الغش", callback_data="anti_cheat_menu")],
+    [InlineKeyboardButton("🏅 إدارة الفائزين", callback_data="manage_winners")],
+    [InlineKeyboardButton("📣 بث موجّه", callback_data="segment_menu")],
+    [InlineKeyboardButton("🔬 التشخيص", callback_data="diagnostics_menu")],
+])
+ANTI_CHEAT_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("👁️ عرض السجل", callback_data="view_cheat_logs")],
+    [InlineKeyboardButton("🚫 حظر جماعي", callback_data="bulk_ban"),
+     InlineKeyboardButton("♻️ رفع حظر جماعي", callback_data="bulk_unban")],
+    [InlineKeyboardButton("📥 استيراد مستخدمين", callback_data="bulk_import")],
+    [InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]
+])
+
+# لا يُرسل طلب التعديل إن كانت الرسالة تعرض المحتوى نفسه (ويُتجاهل خطأ "message is not modified").
+# تيليجرام يحذف المسافات والأسطر الفارغة من طرفي النص المحفوظ، فتُقارن بعد strip
+async def edit_message(q, text, reply_markup=None, **kwargs):
+    current = q.message
+    if current is not None and current.text == text.strip() and current.reply_markup == reply_markup:
+        return
+    try:
+        await q.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+
 # === تهيئة قاعدة البيانات ===
+# ارفع الرقم عند أي تغيير في الجداول أو الفهارس أو المشغّلات؛ عند تطابقه مع user_version يُتخطى DDL
+SCHEMA_VERSION = 4
+
 def initialize_database():
-    db_path = 'contest.db'
-    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     cursor = conn.cursor()
+    if cursor.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        return conn
+    # يجب ضبطه قبل إنشاء الجداول (وقبل WAL)؛ القواعد القائمة تُحوَّل مرة واحدة: python retention.py enable-incremental-vacuum
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # WAL يسمح للقرّاء في الخيوط الخلفية (التصدير وغيره) بالعمل دون حجب الكتابة
+    cursor.execute("PRAGMA journal_mode=WAL")
     
     cursor.execute('''CREATE TABLE IF NOT EXISTS users (
         user_id INTEGER PRIMARY KEY,
@@ -52,6 +174,65 @@ def initialize_database():
         cursor.execute("ALTER TABLE users ADD COLUMN has_verified INTEGER DEFAULT 0")
     except sqlite3.OperationalError:
         pass
+    # 0 = المستخدم حظر البوت ولا يمكن مراسلته
+    try:
+        cursor.execute("ALTER TABLE users ADD COLUMN reachable INTEGER DEFAULT 1")
+    except sqlite3.OperationalError:
+        pass
+    # وقت التحقق (unix) لمعرفة الإحالات المحتسبة منذ آخر تصفير للنقاط
+    try:
+        cursor.execute("ALTER TABLE users ADD COLUMN verified_at INTEGER")
+    except sqlite3.OperationalError:
+        pass
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_rank ON users (banned, points DESC)")
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_users_verified_referrals
+                      ON users (referred_by, verified_at) WHERE has_verified = 1""")
+    # فهارس شرائح البث الموجّه (المُحالون من مستخدم، والمتحققون حديثًا)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users (referred_by)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_verified_at ON users (verified_at) WHERE has_verified = 1")
+    
+    # حالة المهام الخلفية (نقاط الاستئناف والتقدم)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS app_state (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    ) WITHOUT ROWID''')
+    
+    # فهارس منع التكرار: التحديثات المستلمة ومفاتيح الإجراءات المنفذة
+    cursor.execute('''CREATE TABLE IF NOT EXISTS processed_updates (
+        update_id INTEGER PRIMARY KEY,
+        seen_at INTEGER NOT NULL
+    )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_updates_seen ON processed_updates (seen_at)")
+    cursor.execute('''CREATE TABLE IF NOT EXISTS processed_actions (
+        key TEXT PRIMARY KEY,
+        created_at INTEGER NOT NULL
+    ) WITHOUT ROWID''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_actions_created ON processed_actions (created_at)")
+
+    # صندوق الإشعارات الصادرة: يُكتب في معاملة تغيير الحالة نفسها ويُرسل لاحقًا في الخلفية
+    cursor.execute('''CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY,
+        chat_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        created_at INTEGER NOT NULL,
+        attempts INTEGER DEFAULT 0,
+        next_attempt_at INTEGER DEFAULT 0
+    )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (next_attempt_at, id)")
+    # إشعارات قابلة للدمج (digest_key) وعدد الأحداث المدموجة فيها
+    try:
+        cursor.execute("ALTER TABLE outbox ADD COLUMN digest_key TEXT")
+        cursor.execute("ALTER TABLE outbox ADD COLUMN digest_count INTEGER DEFAULT 1")
+    except sqlite3.OperationalError:
+        pass
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_outbox_digest
+                      ON outbox (chat_id, digest_key, next_attempt_at) WHERE digest_key IS NOT NULL""")
+    
+    # آخر أحداث الانضمام/المغادرة لكل مستخدم (تُحفظ من الذاكرة بشكل كسول)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS join_tracker (
+        user_id INTEGER PRIMARY KEY,
+        events TEXT NOT NULL
+    )''')
     
     cursor.execute('''CREATE TABLE IF NOT EXISTS contests (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -61,6 +242,7 @@ def initialize_database():
         status TEXT DEFAULT 'active',
         winner_count INTEGER DEFAULT 3
     )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_contests_status_end ON contests (status, end_time, id)")
     
     cursor.execute('''CREATE TABLE IF NOT EXISTS cheat_logs (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -69,11 +251,136 @@ def initialize_database():
         type TEXT DEFAULT 'mutual_referral',
         detected_at TEXT
     )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cheat_logs_detected ON cheat_logs (detected_at)")
+    
+    # عدّادات الإحصائيات تُحدَّث عبر المشغّلات بدل المسح الكامل للجداول
+    cursor.execute('''CREATE TABLE IF NOT EXISTS stats_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )''')
+    cursor.execute("SELECT COUNT(*) FROM stats_counters")
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany("INSERT INTO stats_counters (name, value) VALUES (?, ?)",
+                           compute_statistics(cursor).items())
     
+    cursor.executescript('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_insert_stats AFTER INSERT ON users
+        BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'total_users';
+            UPDATE stats_counters SET value = value + (NEW.banned = 1) WHERE name = 'banned_users';
+            UPDATE stats_counters SET value = value + COALESCE(NEW.points, 0) WHERE name = 'total_points';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_users_delete_stats AFTER DELETE ON users
+        BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'total_users';
+            UPDATE stats_counters SET value = value - (OLD.banned = 1) WHERE name = 'banned_users';
+            UPDATE stats_counters SET value = value - COALESCE(OLD.points, 0) WHERE name = 'total_points';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_users_banned_stats AFTER UPDATE OF banned ON users
+        WHEN (NEW.banned = 1) != (OLD.banned = 1)
+        BEGIN
+            UPDATE stats_counters SET value = value + (NEW.banned = 1) - (OLD.banned = 1) WHERE name = 'banned_users';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_users_points_stats AFTER UPDATE OF points ON users
+        WHEN COALESCE(NEW.points, 0) != COALESCE(OLD.points, 0)
+        BEGIN
+            UPDATE stats_counters SET value = value + COALESCE(NEW.points, 0) - COALESCE(OLD.points, 0) WHERE name = 'total_points';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_contests_insert_stats AFTER INSERT ON contests
+        BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'total_contests';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_contests_delete_stats AFTER DELETE ON contests
+        BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'total_contests';
+        END;
+    ''')
+    
+    # تجميعات زمنية (ساعية ويومية) للوحة التحكم — لا تحتاج أبدًا لمسح users أو cheat_logs
+    cursor.execute('''CREATE TABLE IF NOT EXISTS stats_rollups (
+        granularity TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        value INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, bucket, metric)
+    ) WITHOUT ROWID''')
+    cursor.executescript(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_joins AFTER INSERT ON users
+        BEGIN
+            {rollup_sql('joins', '1')}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_verifications AFTER UPDATE OF has_verified ON users
+        WHEN NEW.has_verified = 1 AND COALESCE(OLD.has_verified, 0) != 1
+        BEGIN
+            {rollup_sql('verifications', '1')}
+        END;
+
+        -- الإحالات تُحتسب من أحداث التحقق فقط؛ الاستيراد الجماعي وإصلاح النقاط يغيّران
+        -- successful_referrals دون أن تحدث إحالة جديدة
+        DROP TRIGGER IF EXISTS trg_rollup_referrals;
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_verified_referrals AFTER UPDATE OF has_verified ON users
+        WHEN NEW.has_verified = 1 AND COALESCE(OLD.has_verified, 0) != 1
+             AND NEW.referred_by IS NOT NULL AND NEW.referred_by != NEW.user_id
+             AND EXISTS (SELECT 1 FROM users WHERE user_id = NEW.referred_by)
+        BEGIN
+            {rollup_sql('referrals', '1')}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_bans AFTER UPDATE OF banned ON users
+        WHEN NEW.banned = 1 AND COALESCE(OLD.banned, 0) != 1
+        BEGIN
+            {rollup_sql('bans', '1')}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_cheats AFTER INSERT ON cheat_logs
+        BEGIN
+            {rollup_sql('cheats', '1')}
+        END;
+    ''')
+    
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
     return conn
 
-db_connection = initialize_database()
+ROLLUP_METRICS = ('joins', 'verifications', 'referrals', 'bans', 'cheats')
+ROLLUP_BUCKETS = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d'}
+
+# جمل الإضافة إلى الدلاء الساعية واليومية (تُضمَّن داخل المشغّلات)
+def rollup_sql(metric, amount):
+    return "\n".join(
+        f"INSERT INTO stats_rollups (granularity, bucket, metric, value) "
+        f"VALUES ('{g}', strftime('{fmt}', 'now', 'localtime'), '{metric}', {amount}) "
+        f"ON CONFLICT (granularity, bucket, metric) DO UPDATE SET value = value + excluded.value;"
+        for g, fmt in ROLLUP_BUCKETS.items()
+    )
+
+# الإحصائيات الحقيقية بمسح الجداول — تُستخدم للتهيئة والمطابقة الليلية فقط
+def compute_statistics(cursor):
+    stats = {}
+    cursor.execute("SELECT COUNT(*) FROM users")
+    stats['total_users'] = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM users WHERE banned = 1")
+    stats['banned_users'] = cursor.fetchone()[0]
+    cursor.execute("SELECT SUM(points) FROM users")
+    stats['total_points'] = cursor.fetchone()[0] or 0
+    cursor.execute("SELECT COUNT(*) FROM contests")
+    stats['total_contests'] = cursor.fetchone()[0]
+    return stats
+
+# لا شيء يلمس قاعدة البيانات عند الاستيراد؛ تُفتح من build_application
+db_connection = None
+
+def open_database():
+    global db_connection
+    if db_connection is None:
+        db_connection = initialize_database()
+    return db_connection
 
 # === وظائف قاعدة البيانات ===
 def get_user_data(uid):
@@ -94,39 +401,447 @@ def add_new_user(uid, un, fn, ref=None):
                  (user_id, username, full_name, referred_by, last_join_time, has_verified) 
                  VALUES (?, ?, ?, ?, ?, 0)""",
               (uid, un or 'unknown', fn or 'unknown', ref, now))
+    if uid not in reachable_users:
+        c.execute("UPDATE users SET reachable = 1 WHERE user_id = ?", (uid,))
+        reachable_users.add(uid)
     db_connection.commit()
 
-def increment_join_count(uid):
+# === مجموعات المستخدمين في الذاكرة (محظور/متحقق/يمكن مراسلته) ===
+# حتى يكتمل تحميلها في الخلفية (warm_caches) يُجاب عن الفحص من قاعدة البيانات،
+# وتُسجّل التعديلات لتُعاد على المجموعة المحمّلة فلا يضيع ما تغيّر أثناء التحميل
+class ColdUserSet:
+    def __init__(self, condition):
+        self.condition = condition
+        self.journal = []
+
+    def __contains__(self, uid):
+        c = db_connection.cursor()
+        c.execute(f"SELECT 1 FROM users WHERE user_id = ? AND {self.condition}", (uid,))
+        return c.fetchone() is not None
+
+    def add(self, uid):
+        self.journal.append((True, (uid,)))
+
+    def discard(self, uid):
+        self.journal.append((False, (uid,)))
+
+    def update(self, uids):
+        self.journal.append((True, list(uids)))
+
+    def difference_update(self, uids):
+        self.journal.append((False, list(uids)))
+
+    def replay(self, bitmap):
+        for adding, uids in self.journal:
+            if adding:
+                bitmap.update(uids)
+            else:
+                bitmap.difference_update(uids)
+        return bitmap
+
+USER_SET_CONDITIONS = ("banned = 1", "has_verified = 1", "reachable = 1")
+banned_users, verified_users, reachable_users = (ColdUserSet(cond) for cond in USER_SET_CONDITIONS)
+
+def read_user_bitmaps(conn):
+    c = conn.cursor()
+    result = []
+    for condition in USER_SET_CONDITIONS:
+        c.execute(f"SELECT user_id FROM users WHERE {condition} ORDER BY user_id")
+        result.append(RoaringBitmap.from_sorted(r[0] for r in c))
+    return result
+
+def user_bitmaps_loaded():
+    return not isinstance(banned_users, ColdUserSet)
+
+def install_user_bitmaps(bitmaps):
+    global banned_users, verified_users, reachable_users
+    if user_bitmaps_loaded():
+        return
+    banned_users, verified_users, reachable_users = (
+        cold.replay(bitmap) for cold, bitmap in zip((banned_users, verified_users, reachable_users), bitmaps))
+
+# تحميل متزامن على الاتصال الرئيسي: للمسارات التي تحتاج المجموعة كاملة قبل اكتمال التحميل الخلفي
+def load_user_bitmaps():
+    install_user_bitmaps(read_user_bitmaps(db_connection))
+
+def read_user_bitmaps_readonly():
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    try:
+        return read_user_bitmaps(conn)
+    finally:
+        conn.close()
+
+# مستلمو البث: كل من يمكن مراسلته وليس محظورًا
+def broadcast_recipients(exclude=()):
+    if not user_bitmaps_loaded():
+        load_user_bitmaps()
+    recipients = reachable_users - banned_users
+    if exclude:
+        recipients = recipients - RoaringBitmap(exclude)
+    return recipients
+
+def mark_unreachable(uids):
+    uids = [uid for uid in uids if uid in reachable_users]
+    if not uids:
+        return
+    db_connection.executemany("UPDATE users SET reachable = 0 WHERE user_id = ?", [(uid,) for uid in uids])
+    db_connection.commit()
+    reachable_users.difference_update(uids)
+
+# === تتبع الانضمام/المغادرة بنافذة منزلقة ===
+# uid -> deque[(ts, 'join' | 'leave')] بحجم محدود، مع إخراج الأقدم استخدامًا (LRU)
+_join_events = OrderedDict()
+_join_dirty = set()
+
+def load_join_events(uid):
+    events = _join_events.get(uid)
+    if events is not None:
+        _join_events.move_to_end(uid)
+        return events
     c = db_connection.cursor()
-    c.execute("SELECT join_count, banned, last_join_time FROM users WHERE user_id = ?", (uid,))
+    c.execute("SELECT events FROM join_tracker WHERE user_id = ?", (uid,))
     row = c.fetchone()
-    if row and not row[1]:
-        last_time = datetime.fromisoformat(row[2]) if row[2] else None
-        now = datetime.now()
-        if last_time and (now - last_time).total_seconds() < 86400:
-            new = row[0] + 1
-            now_iso = now.isoformat()
-            c.execute("UPDATE users SET join_count = ?, last_join_time = ? WHERE user_id = ?", (new, now_iso, uid))
-            db_connection.commit()
-            if new > MAX_JOIN_ATTEMPTS:
-                c.execute("UPDATE users SET banned = 1 WHERE user_id = ?", (uid,))
-                db_connection.commit()
-                return True
-        else:
-            c.execute("UPDATE users SET join_count = 1, last_join_time = ? WHERE user_id = ?", (now.isoformat(), uid))
-            db_connection.commit()
+    events = deque((tuple(e) for e in json.loads(row[0])) if row else (), maxlen=JOIN_EVENT_BUFFER)
+    _join_events[uid] = events
+    while len(_join_events) > JOIN_TRACKER_MAX_USERS:
+        old_uid, old_events = _join_events.popitem(last=False)
+        if old_uid in _join_dirty:
+            _join_dirty.discard(old_uid)
+            persist_join_events([(old_uid, old_events)])
+    return events
+
+def count_recent_joins(events, now):
+    return sum(1 for ts, kind in events if kind == 'join' and now - ts < JOIN_WINDOW_SECONDS)
+
+def persist_join_events(items):
+    now = time.time()
+    c = db_connection.cursor()
+    c.executemany("INSERT OR REPLACE INTO join_tracker (user_id, events) VALUES (?, ?)",
+                  [(uid, json.dumps(list(events))) for uid, events in items])
+    c.executemany("UPDATE users SET join_count = ?, last_join_time = ? WHERE user_id = ?",
+                  [(count_recent_joins(events, now),
+                    datetime.fromtimestamp(max((ts for ts, k in events if k == 'join'), default=now)).isoformat(),
+                    uid) for uid, events in items])
+    db_connection.commit()
+
+def flush_join_tracker():
+    items = [(uid, _join_events[uid]) for uid in _join_dirty if uid in _join_events]
+    _join_dirty.clear()
+    if items:
+        persist_join_events(items)
+
+# يسجّل تغيّر حالة العضوية فقط (انضمام بعد مغادرة أو العكس)، ويحظر عند تجاوز
+# MAX_JOIN_ATTEMPTS انضمامًا داخل النافذة. يعيد True إذا تم الحظر الآن.
+def record_membership_event(uid, kind, now=None):
+    events = load_join_events(uid)
+    if events and events[-1][1] == kind:
+        return False
+    now = now or time.time()
+    events.append((int(now), kind))
+    _join_dirty.add(uid)
+    if kind != 'join' or count_recent_joins(events, now) <= MAX_JOIN_ATTEMPTS:
+        return False
+    c = db_connection.cursor()
+    c.execute("UPDATE users SET banned = 1 WHERE user_id = ? AND banned = 0", (uid,))
+    db_connection.commit()
+    if c.rowcount:
+        banned_users.add(uid)
+        invalidate_leaderboard()
+        return True
     return False
 
-def award_points(ref_id):
+def award_points(ref_id, commit=True):
     c = db_connection.cursor()
-    c.execute("UPDATE users SET points = points + ?, successful_referrals = successful_referrals + 1 WHERE user_id = ?", 
+    c.execute("UPDATE users SET points = points + ?, successful_referrals = successful_referrals + 1 WHERE user_id = ? RETURNING points", 
               (POINTS_PER_REFERRAL, ref_id))
+    row = c.fetchone()
+    if commit:
+        db_connection.commit()
+    if row and leaderboard_affected_by(row[0]):
+        invalidate_leaderboard()
+    return row[0] if row else None
+
+def get_state(name, default=None):
+    c = db_connection.cursor()
+    c.execute("SELECT value FROM app_state WHERE name = ?", (name,))
+    row = c.fetchone()
+    return row[0] if row else default
+
+def set_state(values, commit=True):
+    db_connection.executemany("INSERT OR REPLACE INTO app_state (name, value) VALUES (?, ?)",
+                              [(k, str(v)) for k, v in values.items()])
+    if commit:
+        db_connection.commit()
+
+# === منع التكرار (idempotency) ===
+# يسجّل مفتاح الإجراء داخل نفس معاملة تغيير الحالة؛ يعيد False إن كان الإجراء قد نُفّذ سابقًا
+def claim_action(c, key):
+    c.execute("INSERT OR IGNORE INTO processed_actions (key, created_at) VALUES (?, ?)", (key, int(time.time())))
+    return c.rowcount == 1
+
+# يضيف إشعارًا إلى صندوق الصادر داخل المعاملة الحالية (بدون commit)
+def enqueue_notification(c, chat_id, text):
+    c.execute("INSERT INTO outbox (chat_id, text, created_at) VALUES (?, ?, ?)", (chat_id, text, int(time.time())))
+
+# === تجميع إشعارات الإحالة ===
+# المُحيل الهادئ يُبلَّغ فورًا. إن تلاحقت إحالاته يُؤجل الإشعار التالي بنافذة، وكل إحالة تصل قبل
+# موعده تُدمج فيه (العدد والرصيد الأحدث)، فيصله إشعار واحد لكل نافذة بدل رسالة لكل إحالة.
+# الصف المستحق لا يُدمج فيه (قد يكون قيد الإرسال)، ولا الصف المؤجل بعد فشل الإرسال (قد يُسقط
+# مع آخر محاولة)، فتبدأ الإحالة التالية إشعارًا جديدًا.
+# referrer -> (وقت آخر إشعار، نافذته بالثواني)
+_digest_windows = OrderedDict()
+
+# تتضاعف النافذة إن جاءت الإحالة بعد موعد الإشعار السابق بقليل، وتنكمش إن تباعدت، وتعود للفوري بعد الهدوء
+def next_digest_window(referrer, now):
+    last, window = _digest_windows.get(referrer, (0, 0))
+    idle = now - (last + window)
+    if idle < max(window, REFERRAL_DIGEST_MIN_SECONDS):
+        window = min(REFERRAL_DIGEST_MAX_SECONDS, max(REFERRAL_DIGEST_MIN_SECONDS, window * 2))
+    elif idle > REFERRAL_DIGEST_MAX_SECONDS or window // 2 < REFERRAL_DIGEST_MIN_SECONDS:
+        window = 0
+    else:
+        window //= 2
+    _digest_windows[referrer] = (now, window)
+    _digest_windows.move_to_end(referrer)
+    if len(_digest_windows) > REFERRAL_DIGEST_TRACKED:
+        _digest_windows.popitem(last=False)
+    return window
+
+def referral_notice_text(count, points):
+    if count == 1:
+        return f"🎉 تم انضمام شخص جديد من خلال رابطك!\nرصيدك الآن: {points} نقطة."
+    return f"🎉 انضم {count} أشخاص جدد من خلال رابطك!\nرصيدك الآن: {points} نقطة."
+
+# داخل معاملة complete_verification (بدون commit)
+def enqueue_referral_notice(c, referrer, points):
+    now = int(time.time())
+    c.execute("""SELECT id, digest_count FROM outbox WHERE chat_id = ? AND digest_key = 'referral'
+                 AND attempts = 0 AND next_attempt_at > ? LIMIT 1""", (referrer, now))
+    pending = c.fetchone()
+    if pending:
+        c.execute("UPDATE outbox SET text = ?, digest_count = ? WHERE id = ?",
+                  (referral_notice_text(pending[1] + 1, points), pending[1] + 1, pending[0]))
+        return
+    c.execute("""INSERT INTO outbox (chat_id, text, created_at, next_attempt_at, digest_key)
+                 VALUES (?, ?, ?, ?, 'referral')""",
+              (referrer, referral_notice_text(1, points), now, now + next_digest_window(referrer, now)))
+
+# تحقق المستخدم ومنح نقاط المُحيل في معاملة واحدة. يعيد (المُحيل، رصيده الجديد) أو None
+# إشعار المُحيل يُكتب في الصندوق ضمن المعاملة نفسها (notify=False للفحص الدوري)
+def complete_verification(uid, notify=True):
+    c = db_connection.cursor()
+    try:
+        if not claim_action(c, f"verify:{uid}"):
+            db_connection.rollback()
+            return None
+        # لا يسبق وقت التحقق points_epoch، فكل ما يُحتسب بعد التصفير يقع داخل الحقبة الجديدة
+        c.execute("""UPDATE users SET has_verified = 1,
+                            verified_at = MAX(?, COALESCE((SELECT CAST(value AS INTEGER) FROM app_state
+                                                           WHERE name = 'points_epoch'), 0))
+                     WHERE user_id = ? AND has_verified = 0 RETURNING referred_by""",
+                  (int(time.time()), uid))
+        row = c.fetchone()
+        result = None
+        if row and row[0] and row[0] != uid:
+            points = award_points(row[0], commit=False)
+            if points is not None:
+                result = (row[0], points)
+                if notify:
+                    enqueue_referral_notice(c, row[0], points)
+        db_connection.commit()
+        if row:
+            verified_users.add(uid)
+        return result
+    except Exception:
+        db_connection.rollback()
+        raise
+
+# سحب إحالة مستخدم غادر القناة: يُعاد لغير متحقق، وتُخصم نقاط المُحيل وتُحتسب إحالة فاشلة.
+# الإحالة المتحققة قبل آخر تصفير (points_epoch) لم تعد ضمن نقاط المُحيل فلا يُخصم منه شيء،
+# كما في repair_points. يعيد معرف المُحيل المتأثر أو None
+def revoke_verification(uid):
+    c = db_connection.cursor()
+    try:
+        epoch = int(get_state('points_epoch', 0))
+        c.execute("""UPDATE users SET has_verified = 0 WHERE user_id = ? AND has_verified = 1
+                     RETURNING referred_by, COALESCE(verified_at, 0) >= ?""", (uid, epoch))
+        row = c.fetchone()
+        ref_by = row[0] if row and row[0] and row[0] != uid and row[1] else None
+        if ref_by:
+            c.execute("""UPDATE users SET points = MAX(points - ?, 0),
+                                          successful_referrals = MAX(successful_referrals - 1, 0),
+                                          failed_referrals = failed_referrals + 1
+                         WHERE user_id = ?""", (POINTS_PER_REFERRAL, ref_by))
+        # يسمح بإعادة احتساب الإحالة إن عاد المستخدم وتحقق من جديد
+        c.execute("DELETE FROM processed_actions WHERE key = ?", (f"verify:{uid}",))
+        db_connection.commit()
+    except Exception:
+        db_connection.rollback()
+        raise
+    if row:
+        verified_users.discard(uid)
+    if ref_by:
+        invalidate_leaderboard()
+    return ref_by
+
+# update_id -> وقت الاستلام؛ نافذة محدودة في الذاكرة تُحفظ دوريًا في processed_updates
+_recent_updates = OrderedDict()
+_unsaved_updates = []
+
+def load_recent_updates():
+    c = db_connection.cursor()
+    c.execute("SELECT update_id, seen_at FROM processed_updates ORDER BY update_id DESC LIMIT ?", (UPDATE_DEDUP_MEMORY,))
+    for update_id, seen_at in reversed(c.fetchall()):
+        _recent_updates[update_id] = seen_at
+
+def is_duplicate_update(update_id):
+    if update_id in _recent_updates:
+        return True
+    now = int(time.time())
+    _recent_updates[update_id] = now
+    _unsaved_updates.append((update_id, now))
+    while len(_recent_updates) > UPDATE_DEDUP_MEMORY:
+        _recent_updates.popitem(last=False)
+    return False
+
+def flush_processed_updates():
+    if _unsaved_updates:
+        rows = _unsaved_updates[:]
+        _unsaved_updates.clear()
+        db_connection.executemany("INSERT OR IGNORE INTO processed_updates (update_id, seen_at) VALUES (?, ?)", rows)
+        db_connection.commit()
+
+def prune_processed_keys():
+    cutoff = int(time.time()) - IDEMPOTENCY_WINDOW_SECONDS
+    c = db_connection.cursor()
+    c.execute("DELETE FROM processed_updates WHERE seen_at < ?", (cutoff,))
+    c.execute("DELETE FROM processed_actions WHERE created_at < ?", (cutoff,))
     db_connection.commit()
 
 def reset_points():
     c = db_connection.cursor()
     c.execute("UPDATE users SET points = 0, successful_referrals = 0, failed_referrals = 0")
+    # الإحالات المتحققة قبل هذه اللحظة لا تُحتسب عند إعادة حساب النقاط. verified_at بالثواني،
+    # فالحقبة تبدأ من الثانية التالية: ما تحقق في ثانية التصفير قبله يبقى خارجها، وما يتحقق بعده
+    # يأخذ verified_at لا يقل عن الحقبة (complete_verification). المقارنة في كل مكان: verified_at >= points_epoch
+    set_state({'points_epoch': int(time.time()) + 1}, commit=False)
     db_connection.commit()
+    invalidate_leaderboard()
+
+# === إعادة حساب النقاط وإصلاح الانحراف ===
+# النقاط والإحالات الناجحة تُشتق من المستخدمين المتحققين المُحالين منذ آخر تصفير (points_epoch).
+# يُحسب الفرق بمرور GROUP BY واحد على اتصال قراءة في خيط خلفي، ثم تُطبّق الإصلاحات على دفعات.
+# قبل أول تصفير بعد إضافة verified_at لا نعرف أي إحالة قديمة ما زالت محتسبة، فيكون التقرير بلا تطبيق.
+def compute_points_drift(epoch):
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    try:
+        c = conn.cursor()
+        c.execute("""SELECT u.user_id, u.points, u.successful_referrals, COALESCE(r.n, 0)
+                     FROM users u LEFT JOIN (
+                         SELECT referred_by, COUNT(*) AS n FROM users
+                         WHERE has_verified = 1 AND referred_by IS NOT NULL AND referred_by != user_id
+                               AND COALESCE(verified_at, 0) >= ?
+                         GROUP BY referred_by
+                     ) r ON r.referred_by = u.user_id
+                     WHERE u.points != COALESCE(r.n, 0) * ? OR u.successful_referrals != COALESCE(r.n, 0)""",
+                  (epoch, POINTS_PER_REFERRAL))
+        return c.fetchall()
+    finally:
+        conn.close()
+
+# يطبّق دفعة إصلاحات بشرط أن القيم المخزنة لم تتغير منذ الحساب؛ ما تغيّر يُترك للدورة التالية
+def apply_points_repairs(rows):
+    c = db_connection.cursor()
+    fixed = 0
+    for uid, points, refs, expected in rows:
+        c.execute("""UPDATE users SET points = ?, successful_referrals = ?
+                     WHERE user_id = ? AND points = ? AND successful_referrals = ?""",
+                  (expected * POINTS_PER_REFERRAL, expected, uid, points, refs))
+        fixed += c.rowcount
+    db_connection.commit()
+    return fixed
+
+async def repair_points():
+    epoch = get_state('points_epoch')
+    drift = await asyncio.to_thread(compute_points_drift, int(epoch or 0))
+    result = {'drift': len(drift), 'fixed': 0, 'skipped': 0, 'applied': epoch is not None}
+    if epoch is not None:
+        for i in range(0, len(drift), POINTS_REPAIR_CHUNK):
+            result['fixed'] += apply_points_repairs(drift[i:i + POINTS_REPAIR_CHUNK])
+            await asyncio.sleep(0)
+        result['skipped'] = len(drift) - result['fixed']
+        if result['fixed']:
+            invalidate_leaderboard()
+    set_state({'points_repair_last': json.dumps({'at': datetime.now().isoformat(), **result})})
+    return result
+
+# === لوحة الصدارة (صفحات بمؤشر keyset مع تخزين مؤقت للنص) ===
+# page -> (text, markup, end_cursor)
+_leaderboard_pages = {}
+_leaderboard_state = {'built_at': 0.0, 'cutoff': None}
+
+def invalidate_leaderboard():
+    _leaderboard_pages.clear()
+    _inline_state['top'] = None
+    _leaderboard_state['cutoff'] = None
+
+# هل يدخل مستخدم بهذه النقاط ضمن الصفحات المخزنة؟ إن لم توجد صفحات فلا داعي للإبطال
+def leaderboard_affected_by(points):
+    cutoff = _leaderboard_state['cutoff']
+    return cutoff is not None and points >= cutoff
+
+def fetch_leaderboard_rows(after=None, limit=LEADERBOARD_PAGE_SIZE):
+    c = db_connection.cursor()
+    if after is None:
+        c.execute("""SELECT user_id, username, full_name, points FROM users WHERE banned = 0
+                     ORDER BY points DESC, user_id LIMIT ?""", (limit,))
+    else:
+        c.execute("""SELECT user_id, username, full_name, points FROM users WHERE banned = 0
+                     AND (points < ? OR (points = ? AND user_id > ?))
+                     ORDER BY points DESC, user_id LIMIT ?""", (after[0], after[0], after[1], limit))
+    return c.fetchall()
+
+def get_leaderboard_page(page):
+    now = time.monotonic()
+    if now - _leaderboard_state['built_at'] > LEADERBOARD_CACHE_SECONDS:
+        invalidate_leaderboard()
+        _leaderboard_state['built_at'] = now
+    if page in _leaderboard_pages:
+        return _leaderboard_pages[page]
+
+    after = None
+    if page > 1:
+        after = get_leaderboard_page(page - 1)[2]
+        if after is None:
+            return get_leaderboard_page(page - 1)
+    rows = fetch_leaderboard_rows(after, LEADERBOARD_PAGE_SIZE + 1)
+    more_rows = len(rows) > LEADERBOARD_PAGE_SIZE
+    has_next = more_rows and page < LEADERBOARD_MAX_PAGES
+    rows = rows[:LEADERBOARD_PAGE_SIZE]
+
+    text = f"🏅 لوحة الصدارة — الصفحة {page}\n━━━━━━━━━━━━━━━━\n"
+    if not rows:
+        text += "📭 لا يوجد مشاركون بعد."
+    first_rank = (page - 1) * LEADERBOARD_PAGE_SIZE + 1
+    for i, r in enumerate(rows, first_rank):
+        un = f"@{r[1]}" if r[1] != 'unknown' else r[2]
+        text += f"{i}. {un} — {r[3]} نقطة\n"
+
+    nav = []
+    if page > 1:
+        nav.append(InlineKeyboardButton("⬅️ السابق", callback_data=f"leaderboard_{page - 1}"))
+    if has_next:
+        nav.append(InlineKeyboardButton("التالي ➡️", callback_data=f"leaderboard_{page + 1}"))
+    kb = [nav] if nav else []
+    kb.append([InlineKeyboardButton("🔙 رجوع", callback_data="back_main")])
+
+    end_cursor = (rows[-1][3], rows[-1][0]) if has_next else None
+    # إن عرضت الصفحة آخر المشاركين فأي نقاط جديدة قد تغيّرها
+    page_cutoff = rows[-1][3] if more_rows else 0
+    cutoff = _leaderboard_state['cutoff']
+    _leaderboard_state['cutoff'] = page_cutoff if cutoff is None else min(cutoff, page_cutoff)
+    _leaderboard_pages[page] = (text, InlineKeyboardMarkup(kb), end_cursor)
+    return _leaderboard_pages[page]
 
 def get_winners(n):
     c = db_connection.cursor()
@@ -138,49 +853,210 @@ def create_contest(title, desc, end, winner_count):
     c.execute("INSERT INTO contests (title, description, end_time, winner_count) VALUES (?, ?, ?, ?)", 
               (title, desc, end, winner_count))
     db_connection.commit()
+    bump_contest_version()
     return c.lastrowid
 
-def get_all_contests():
+# === فهرس المسابقات في الذاكرة ===
+# المسابقات قليلة ولا تتغير إلا بإجراء من الأدمن، فتُحمّل كلها مرة واحدة لكل إصدار.
+# أي تعديل يرفع رقم الإصدار فيُعاد التحميل عند أول قراءة بعده.
+_contest_state = {'version': 0, 'loaded': -1}
+_contest_catalog = {'by_id': {}, 'by_status': {}, 'keys': {}, 'all': ()}
+_contest_details = {}
+# العرض -> الصفحة الأولى (text, markup)
+_contest_pages = {}
+
+def bump_contest_version():
+    _contest_state['version'] += 1
+
+CONTEST_DETAILS_BACK = back_keyboard("back_main")
+
+def render_contest_details(contest):
+    return f"📌 {contest[1]}\n\n{contest[2]}\n\n⏰ تنتهي: {contest[3]}", CONTEST_DETAILS_BACK
+
+def contest_catalog():
+    if _contest_state['loaded'] == _contest_state['version']:
+        return _contest_catalog
+    version = _contest_state['version']
     c = db_connection.cursor()
-    c.execute("SELECT * FROM contests ORDER BY end_time DESC")
-    return c.fetchall()
+    c.execute("SELECT * FROM contests ORDER BY end_time ASC, id ASC")
+    rows = c.fetchall()
+    by_status = {}
+    for row in rows:
+        by_status.setdefault(row[4], []).append(row)
+    _contest_catalog['by_id'] = {row[0]: row for row in rows}
+    _contest_catalog['by_status'] = by_status
+    # مفاتيح الترتيب (end_time, id) تصاعدياً لكل حالة للبحث الثنائي عند التصفح
+    _contest_catalog['keys'] = {st: [(r[3], r[0]) for r in lst] for st, lst in by_status.items()}
+    _contest_catalog['all'] = tuple(reversed(rows))
+    _contest_details.clear()
+    _contest_details.update((row[0], render_contest_details(row)) for row in rows)
+    _contest_pages.clear()
+    _contest_state['loaded'] = version
+    return _contest_catalog
+
+def get_all_contests():
+    return contest_catalog()['all']
 
 def get_active_contests():
-    c = db_connection.cursor()
-    c.execute("SELECT * FROM contests WHERE status = 'active'")
-    return c.fetchall()
+    return list(contest_catalog()['by_status'].get('active', ()))
 
 def update_contest_status(contest_id, status):
     c = db_connection.cursor()
     c.execute("UPDATE contests SET status = ? WHERE id = ?", (status, contest_id))
     db_connection.commit()
+    bump_contest_version()
 
 def get_contest_by_id(contest_id):
+    return contest_catalog()['by_id'].get(contest_id)
+
+def read_counters():
     c = db_connection.cursor()
-    c.execute("SELECT * FROM contests WHERE id = ?", (contest_id,))
-    return c.fetchone()
+    c.execute("SELECT name, value FROM stats_counters")
+    return dict(c.fetchall())
 
 def get_user_statistics():
-    c = db_connection.cursor()
-    stats = {}
-    c.execute("SELECT COUNT(*) FROM users")
-    stats['total_users'] = c.fetchone()[0]
-    c.execute("SELECT COUNT(*) FROM users WHERE banned = 1")
-    stats['banned_users'] = c.fetchone()[0]
-    c.execute("SELECT SUM(points) FROM users")
-    stats['total_points'] = c.fetchone()[0] or 0
-    c.execute("SELECT COUNT(*) FROM contests")
-    stats['total_contests'] = c.fetchone()[0]
+    stats = {'total_users': 0, 'banned_users': 0, 'total_points': 0, 'total_contests': 0}
+    stats.update(read_counters())
+    # المسابقات المؤرشفة (retention.py) تبقى محسوبة في الإجمالي
+    stats['total_contests'] += stats.pop('archived_contests', 0)
+    return stats
+
+# يقرأ العدّادات والإحصائيات الحقيقية من لقطة واحدة (معاملة قراءة) على اتصال مستقل في خيط خلفي،
+# ويعيد الفروقات المكتشفة: اسم العدّاد -> (المخزن، الحقيقي)
+def compute_statistics_drift():
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, isolation_level=None)
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN")
+        actual = compute_statistics(c)
+        stored = dict(c.execute("SELECT name, value FROM stats_counters").fetchall())
+        c.execute("COMMIT")
+    finally:
+        conn.close()
+    return {k: (stored.get(k), v) for k, v in actual.items() if stored.get(k) != v}
+
+# يطابق العدّادات مع الإحصائيات الحقيقية ويصحح أي انحراف، ويعيد الفروقات المكتشفة.
+# التصحيح فرق يُضاف للقيمة الحالية، فلا تضيع تغييرات المشغّلات التي حدثت بعد اللقطة
+async def reconcile_statistics():
+    drift = await asyncio.to_thread(compute_statistics_drift)
+    if drift:
+        db_connection.executemany("""INSERT INTO stats_counters (name, value) VALUES (?, ?)
+                                     ON CONFLICT (name) DO UPDATE SET value = value + ?""",
+                                  [(k, actual, actual - (stored or 0)) for k, (stored, actual) in drift.items()])
+        db_connection.commit()
+    return drift
+
+# === تصدير البيانات ===
+EXPORT_QUERIES = {
+    'users': "SELECT * FROM users ORDER BY user_id",
+    'leaderboard': """SELECT ROW_NUMBER() OVER (ORDER BY points DESC) AS rank, user_id, username, full_name, points
+                      FROM users WHERE banned = 0 ORDER BY points DESC""",
+    'cheat_logs': "SELECT * FROM cheat_logs ORDER BY id",
+}
+EXPORT_CHUNK_SIZE = 5000
+
+# يُشغَّل في خيط خلفي باتصال قراءة مستقل، ويكتب على دفعات فتبقى الذاكرة ثابتة
+def export_to_file(kind, fmt):
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    fd, path = tempfile.mkstemp(prefix=f"{kind}_", suffix=f".{fmt}.gz")
+    os.close(fd)
+    try:
+        c = conn.cursor()
+        c.execute(EXPORT_QUERIES[kind])
+        columns = [d[0] for d in c.description]
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f) if fmt == 'csv' else None
+            if writer:
+                writer.writerow(columns)
+            while True:
+                rows = c.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                if writer:
+                    writer.writerows(rows)
+                else:
+                    f.writelines(json.dumps(dict(zip(columns, r)), ensure_ascii=False) + "\n" for r in rows)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        conn.close()
+    return path
+
+# === العمليات الجماعية (حظر/رفع حظر/استيراد من ملف) ===
+BULK_ACTIONS = ('ban', 'unban', 'import')
+ID_LINE_RE = re.compile(r"^\s*(\d+)\s*(?:[,;\t]\s*([^,;\t]*))?(?:[,;\t]\s*([^,;\t]*))?")
+
+# يقرأ الملف سطرًا سطرًا: أول عمود هو المعرف، وللاستيراد يُقرأ اليوزر والاسم إن وُجدا
+def iter_bulk_rows(path, stats):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            m = ID_LINE_RE.match(line)
+            if not m:
+                if line.strip():
+                    stats['skipped'] += 1
+                continue
+            uid = int(m.group(1))
+            if uid in ADMIN_IDS:
+                stats['skipped'] += 1
+                continue
+            yield uid, (m.group(2) or '').strip().lstrip('@') or 'unknown', (m.group(3) or '').strip() or 'unknown'
+
+# تُشغَّل في خيط خلفي باتصال كتابة مستقل؛ كل دفعة معاملة واحدة بـ executemany
+def apply_bulk_chunk(conn, action, rows_iter):
+    rows = list(islice(rows_iter, BULK_CHUNK_SIZE))
+    if not rows:
+        return None
+    c = conn.cursor()
+    with conn:
+        if action == 'ban':
+            c.executemany("UPDATE users SET banned = 1 WHERE user_id = ? AND banned = 0", [(r[0],) for r in rows])
+            changed = c.rowcount
+        elif action == 'unban':
+            c.executemany("UPDATE users SET banned = 0, join_count = 0 WHERE user_id = ? AND banned = 1", [(r[0],) for r in rows])
+            changed = c.rowcount
+            c.executemany("DELETE FROM join_tracker WHERE user_id = ?", [(r[0],) for r in rows])
+        else:
+            # من لم يبدأ البوت بعد لا يمكن مراسلته؛ add_new_user يجعله reachable عند /start
+            now = datetime.now().isoformat()
+            c.executemany("""INSERT OR IGNORE INTO users (user_id, username, full_name, last_join_time, has_verified, reachable)
+                             VALUES (?, ?, ?, ?, 0, 0)""", [(uid, un, fn, now) for uid, un, fn in rows])
+            return [r[0] for r in rows], c.rowcount, []
+        # المعرفات الموجودة فعلًا بعد التطبيق، لتحديث المجموعات في الذاكرة
+        ids_json = json.dumps([r[0] for r in rows])
+        state = "AND banned = 1" if action == 'ban' else "AND banned = 0"
+        c.execute(f"SELECT user_id FROM users WHERE user_id IN (SELECT value FROM json_each(?)) {state}", (ids_json,))
+        existing = [r[0] for r in c.fetchall()]
+    return [r[0] for r in rows], changed, existing
+
+async def run_bulk_action(action, path, progress):
+    stats = {'read': 0, 'changed': 0, 'skipped': 0}
+    rows_iter = iter_bulk_rows(path, stats)
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+    try:
+        while True:
+            result = await asyncio.to_thread(apply_bulk_chunk, conn, action, rows_iter)
+            if result is None:
+                break
+            uids, changed, existing = result
+            stats['read'] += len(uids)
+            stats['changed'] += changed
+            if action == 'ban':
+                banned_users.update(existing)
+            elif action == 'unban':
+                banned_users.difference_update(existing)
+                for uid in uids:
+                    _join_events.pop(uid, None)
+                    _join_dirty.discard(uid)
+            await progress(stats)
+    finally:
+        conn.close()
+    if action != 'import':
+        invalidate_leaderboard()
     return stats
 
 # === معالجة الغش الثنائي ===
 async def handle_cheater_pair(context: ContextTypes.DEFAULT_TYPE, user1_id: int, user2_id: int):
-    c = db_connection.cursor()
-    c.execute("UPDATE users SET banned = 1 WHERE user_id IN (?, ?)", (user1_id, user2_id))
-    c.execute("INSERT INTO cheat_logs (cheater1_id, cheater2_id, detected_at) VALUES (?, ?, ?)",
-              (user1_id, user2_id, datetime.now().isoformat()))
-    db_connection.commit()
-    
     cheat_messages = [
         "🕵️‍♂️ نعرف أنك تحاول، لكن الغش لا يُجدي!",
         "🤖 حسابك مُعلّق لفحص السلوك. هل أنت إنسان حقًا؟",
@@ -188,23 +1064,24 @@ async def handle_cheater_pair(context: ContextTypes.DEFAULT_TYPE, user1_id: int,
         "✋ الغش يُفسد روح المنافسة. تم حظرك."
     ]
     msg_to_user = random.choice(cheat_messages)
-    
-    for uid in [user1_id, user2_id]:
-        try:
-            await context.bot.send_message(uid, msg_to_user)
-        except:
-            pass
-    
     msg = (
         f"⚠️ تم اكتشاف غش ذاتي!\n"
         f"الحسابان: {user1_id} و {user2_id}\n"
         f"تم حظرهما تلقائيًا."
     )
+
+    c = db_connection.cursor()
+    c.execute("UPDATE users SET banned = 1 WHERE user_id IN (?, ?)", (user1_id, user2_id))
+    c.execute("INSERT INTO cheat_logs (cheater1_id, cheater2_id, detected_at) VALUES (?, ?, ?)",
+              (user1_id, user2_id, datetime.now().isoformat()))
+    for uid in [user1_id, user2_id]:
+        enqueue_notification(c, uid, msg_to_user)
     for admin_id in ADMIN_IDS:
-        try:
-            await context.bot.send_message(admin_id, msg)
-        except:
-            pass
+        enqueue_notification(c, admin_id, msg)
+    db_connection.commit()
+    banned_users.update((user1_id, user2_id))
+    invalidate_leaderboard()
+    wake_outbox(context)
 
 # === وظائف مساعدة ===
 async def check_member(ctx, uid):
@@ -214,17 +1091,72 @@ async def check_member(ctx, uid):
     except:
         return False
 
-async def broadcast(ctx, msg, btn_txt=None, btn_data=None):
-    c = db_connection.cursor()
-    c.execute("SELECT user_id FROM users WHERE banned = 0")
-    for (uid,) in c.fetchall():
+# مثل check_member لكن يميّز الخطأ: True/False أو None إن تعذر التحقق
+async def get_membership(ctx, uid):
+    try:
+        cm = await ctx.bot.get_chat_member(CHANNEL_ID, uid)
+    except Exception:
+        return None
+    return is_member_status(cm)
+
+# recipients: شريحة محددة (segment_members) أو الجميع؛ يعيد عدد الرسائل المرسلة
+async def broadcast(ctx, msg, btn_txt=None, btn_data=None, recipients=None):
+    unreachable = []
+    sent = 0
+    for uid in (broadcast_recipients() if recipients is None else recipients):
         try:
             if btn_txt and btn_data:
                 await ctx.bot.send_message(uid, msg, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(btn_txt, callback_data=btn_data)]]))
             else:
                 await ctx.bot.send_message(uid, msg)
+            sent += 1
+        except Forbidden:
+            unreachable.append(uid)
         except:
             pass
+    mark_unreachable(unreachable)
+    runtime_counters['broadcast_sent'] += sent
+    return sent
+
+# === شرائح الجمهور للبث الموجّه ===
+# كل شريحة تُقرأ من فهرس (أو من مجموعات المستخدمين في الذاكرة) بكلفة تتناسب مع حجمها،
+# والفهارس تُحدَّث مع كل كتابة على users فلا تحتاج إعادة بناء
+AUDIENCE_SEGMENTS = {
+    'all': "👥 الجميع",
+    'active': "🔥 المشاركون في المسابقة الحالية",
+    'points': "⭐ من لديهم نقاط",
+    'top': "🏆 أفضل N",
+    'recent': f"🆕 تحققوا خلال آخر {RECENT_VERIFIED_DAYS} أيام",
+    'referred': "🔗 المُحالون من مستخدم",
+    'unverified': "⏳ لم يتحققوا بعد",
+}
+SEGMENT_ARGS = {'top': "أرسل عدد المتصدرين (N):", 'referred': "أرسل آيدي المُحيل:"}
+
+def segment_members(segment, arg=None):
+    if not user_bitmaps_loaded():
+        load_user_bitmaps()
+    if segment == 'all':
+        return broadcast_recipients()
+    if segment == 'unverified':
+        return broadcast_recipients() - verified_users
+    c = db_connection.cursor()
+    if segment == 'active':
+        # من جمع نقاطًا أو تحقق منذ بداية المسابقة الحالية (آخر تصفير)
+        c.execute("""SELECT user_id FROM users WHERE banned = 0 AND points > 0
+                     UNION SELECT user_id FROM users WHERE has_verified = 1 AND verified_at >= ?""",
+                  (int(get_state('points_epoch', 0)),))
+    elif segment == 'points':
+        c.execute("SELECT user_id FROM users WHERE banned = 0 AND points > 0")
+    elif segment == 'top':
+        c.execute("SELECT user_id FROM users WHERE banned = 0 ORDER BY points DESC LIMIT ?", (arg,))
+    elif segment == 'recent':
+        c.execute("SELECT user_id FROM users WHERE has_verified = 1 AND verified_at >= ?",
+                  (int(time.time()) - RECENT_VERIFIED_DAYS * 86400,))
+    elif segment == 'referred':
+        c.execute("SELECT user_id FROM users WHERE referred_by = ?", (arg,))
+    else:
+        raise ValueError(segment)
+    return RoaringBitmap(uid for (uid,) in c if uid in reachable_users and uid not in banned_users)
 
 def get_ref_link(uid):
     return f"https://t.me/{BOT_USERNAME}?start={uid}"
@@ -241,18 +1173,258 @@ async def send_contest_reminder(context: ContextTypes.DEFAULT_TYPE):
 
     if reminder_type == '1h':
         msg = "⏳ تبقى ساعة على انتهاء المسابقة! أكمل إحالاتك الآن!"
-    else:  # '10m'
+        recipients = None
+    else:  # '10m' — يهم المشاركين فقط
         msg = "🚨 تبقى 10 دقائق فقط! هل أنت في الصدارة؟ 🏆"
+        recipients = segment_members('active')
+
+    await broadcast(context, msg, recipients=recipients)
+
+# === الفحص الدوري للعضوية ===
+# يمر على المستخدمين بدفعات (keyset على user_id) مع حفظ نقطة الاستئناف بعد كل دفعة:
+# غير المتحقق المشترك يُتحقق تلقائيًا (وتُمنح نقاط مُحيله)، والمُحال المتحقق الذي غادر تُسحب إحالته.
+class RateBudget:
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second
+        self.next_at = 0.0
+        self.lock = asyncio.Lock()
 
-    await broadcast(context, msg)
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            if self.next_at > now:
+                await asyncio.sleep(self.next_at - now)
+            self.next_at = max(now, self.next_at) + self.interval
+
+_sweep_running = {'active': False}
+
+def fetch_sweep_batch(after_uid):
+    c = db_connection.cursor()
+    c.execute("""SELECT user_id, referred_by, has_verified FROM users
+                 WHERE user_id > ? AND banned = 0 AND (has_verified = 0 OR referred_by IS NOT NULL)
+                 ORDER BY user_id LIMIT ?""", (after_uid, SWEEP_BATCH_SIZE))
+    return c.fetchall()
+
+SWEEP_STATS = ('checked', 'verified', 'revoked', 'banned', 'errors')
+
+async def sweep_user(ctx, row, budget, semaphore, stats):
+    uid, ref_by, has_verified = row
+    async with semaphore:
+        await budget.wait()
+        is_member = await get_membership(ctx, uid)
+    # نفس فحوص verify_handler: تسجيل الانضمام/المغادرة وحظر من يكرر الخروج والدخول
+    if is_member is None:
+        stats['errors'] += 1
+    elif is_member:
+        if record_membership_event(uid, 'join'):
+            stats['banned'] += 1
+        elif not has_verified:
+            complete_verification(uid, notify=False)
+            stats['verified'] += 1
+    else:
+        record_membership_event(uid, 'leave')
+        if has_verified and ref_by:
+            revoke_verification(uid)
+            stats['revoked'] += 1
+
+async def membership_sweep_job(context: ContextTypes.DEFAULT_TYPE):
+    if _sweep_running['active']:
+        return
+    _sweep_running['active'] = True
+    try:
+        budget = RateBudget(SWEEP_RATE_PER_SECOND)
+        semaphore = asyncio.Semaphore(SWEEP_CONCURRENCY)
+        cursor = int(get_state('sweep_cursor', 0))
+        stats = {k: int(get_state(f'sweep_{k}', 0)) for k in SWEEP_STATS}
+        for _ in range(SWEEP_BATCHES_PER_RUN):
+            rows = fetch_sweep_batch(cursor)
+            if not rows:
+                set_state({'sweep_cursor': 0, 'sweep_last_complete': datetime.now().isoformat(),
+                           'sweep_last_stats': json.dumps(stats), **{f'sweep_{k}': 0 for k in SWEEP_STATS}})
+                logging.info(f"اكتملت دورة فحص العضوية: {stats}")
+                return
+            await asyncio.gather(*(sweep_user(context, row, budget, semaphore, stats) for row in rows))
+            cursor = rows[-1][0]
+            stats['checked'] += len(rows)
+            set_state({'sweep_cursor': cursor, **{f'sweep_{k}': v for k, v in stats.items()}})
+    except Exception as e:
+        logging.error(f"فشل فحص العضوية: {e}")
+    finally:
+        _sweep_running['active'] = False
+
+# === إرسال صندوق الإشعارات (outbox) ===
+# الإرسال "مرة واحدة على الأقل": يُحذف الصف بعد نجاح الإرسال، فالانقطاع بينهما قد يكرر إشعارًا
+# لكنه لا يفقده. الفشل المؤقت يُعاد بتأخير متزايد حتى OUTBOX_MAX_ATTEMPTS.
+_outbox_running = {'active': False}
+
+def fetch_due_notifications(now):
+    c = db_connection.cursor()
+    c.execute("""SELECT id, chat_id, text, attempts FROM outbox WHERE next_attempt_at <= ?
+                 ORDER BY next_attempt_at, id LIMIT ?""", (now, OUTBOX_BATCH_SIZE))
+    return c.fetchall()
+
+def reschedule_notification(c, row_id, attempts, delay):
+    c.execute("UPDATE outbox SET attempts = ?, next_attempt_at = ? WHERE id = ?",
+              (attempts, int(time.time() + delay), row_id))
+
+async def drain_outbox(bot):
+    if _outbox_running['active']:
+        return
+    _outbox_running['active'] = True
+    try:
+        while True:
+            rows = fetch_due_notifications(int(time.time()))
+            if not rows:
+                return
+            c = db_connection.cursor()
+            unreachable = []
+            for row_id, chat_id, text, attempts in rows:
+                try:
+                    await bot.send_message(chat_id, text)
+                    runtime_counters['outbox_sent'] += 1
+                except Forbidden:
+                    unreachable.append(chat_id)
+                except RetryAfter as e:
+                    # تجاوز حد الإرسال: ننتظر ثم نعيد جلب الدفعة (الصف ما زال مستحقًا)
+                    db_connection.commit()
+                    await asyncio.sleep(e.retry_after)
+                    break
+                except Exception as e:
+                    if attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+                        logging.error(f"تم إسقاط إشعار إلى {chat_id} بعد {attempts + 1} محاولات: {e}")
+                        runtime_counters['outbox_dropped'] += 1
+                    else:
+                        reschedule_notification(c, row_id, attempts + 1, min(3600, 5 * 2 ** attempts))
+                        db_connection.commit()
+                        continue
+                c.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                db_connection.commit()
+            db_connection.commit()
+            mark_unreachable(unreachable)
+    except Exception as e:
+        logging.error(f"فشل إرسال صندوق الإشعارات: {e}")
+    finally:
+        _outbox_running['active'] = False
+
+# يبدأ الإرسال فورًا في الخلفية دون انتظار، والمهمة الدورية تلتقط ما يتبقى
+def wake_outbox(context):
+    context.application.create_task(drain_outbox(context.bot))
+
+async def outbox_job(context: ContextTypes.DEFAULT_TYPE):
+    await drain_outbox(context.bot)
+
+# === تحديثات عضوية القناة (ChatMember) ===
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
+
+def is_member_status(cm):
+    return cm.status in MEMBER_STATUSES or (cm.status == 'restricted' and getattr(cm, 'is_member', False))
+
+async def track_channel_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cmu = update.chat_member
+    if not cmu or (cmu.chat.username or '').lower() != CHANNEL_USERNAME.lower():
+        return
+    was_member = is_member_status(cmu.old_chat_member)
+    is_member = is_member_status(cmu.new_chat_member)
+    if was_member == is_member:
+        return
+    uid = cmu.new_chat_member.user.id
+    if get_user_data(uid) is None:
+        return
+    record_membership_event(uid, 'join' if is_member else 'leave')
+
+async def flush_join_tracker_job(context: ContextTypes.DEFAULT_TYPE):
+    flush_join_tracker()
+
+async def flush_on_shutdown(application):
+    flush_join_tracker()
+    flush_processed_updates()
+    if update_recorder:
+        update_recorder.close()
+
+# === تحميل الذاكرة المؤقتة في الخلفية بعد بدء الاستقبال ===
+async def warm_caches():
+    t0 = time.perf_counter()
+    try:
+        if not user_bitmaps_loaded():
+            install_user_bitmaps(await asyncio.to_thread(read_user_bitmaps_readonly))
+        contest_catalog()
+        get_leaderboard_page(1)
+        inline_top_text()
+        logging.info(f"اكتمل تحميل الذاكرة المؤقتة خلال {time.perf_counter() - t0:.2f} ث")
+    except Exception as e:
+        logging.error(f"فشل تحميل الذاكرة المؤقتة: {e}")
+
+async def start_warmup(application):
+    application.create_task(warm_caches())
+
+# === منع معالجة التحديث نفسه مرتين (يعمل قبل كل المعالجات) ===
+async def dedup_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _activity['last_update'] = time.monotonic()
+    runtime_counters['updates'] += 1
+    if is_duplicate_update(update.update_id):
+        runtime_counters['duplicate_updates'] += 1
+        logging.warning(f"تم تجاهل تحديث مكرر: {update.update_id}")
+        raise ApplicationHandlerStop
+
+async def flush_processed_updates_job(context: ContextTypes.DEFAULT_TYPE):
+    flush_processed_updates()
+
+async def prune_processed_keys_job(context: ContextTypes.DEFAULT_TYPE):
+    prune_processed_keys()
+
+# === النسخ الاحتياطي المجدول ===
+async def backup_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        path = await asyncio.to_thread(backup.create_backup, DB_PATH, BACKUP_DIR, BACKUP_PAGES_PER_STEP, BACKUP_KEEP)
+        logging.info(f"تم إنشاء نسخة احتياطية: {path}")
+    except Exception as e:
+        logging.error(f"فشل النسخ الاحتياطي: {e}")
+
+# === الأرشفة وتقليص قاعدة البيانات في أوقات الخمول ===
+_activity = {'last_update': 0.0}
+# عدّادات تشغيل في الذاكرة منذ بدء العملية (يعرضها tenants.py لكل بوت)
+runtime_counters = defaultdict(int)
+
+def is_idle():
+    return time.monotonic() - _activity['last_update'] >= RETENTION_IDLE_SECONDS
+
+async def retention_job(context: ContextTypes.DEFAULT_TYPE):
+    conn = retention.open_connection(DB_PATH)
+    try:
+        deadline = time.monotonic() + RETENTION_BUDGET_SECONDS
+        while is_idle() and time.monotonic() < deadline:
+            done = await asyncio.to_thread(retention.retention_step, conn, archive_dir=ARCHIVE_DIR)
+            if done.get('contests'):
+                bump_contest_version()
+            if not any(done.values()):
+                break
+        if is_idle():
+            await asyncio.to_thread(retention.prune_hourly_rollups, conn)
+    except Exception as e:
+        logging.error(f"فشلت مهمة الأرشفة: {e}")
+    finally:
+        conn.close()
+
+async def repair_points_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        result = await repair_points()
+        if result['drift']:
+            logging.warning(f"انحراف في النقاط: {result}")
+    except Exception as e:
+        logging.error(f"فشل إصلاح النقاط: {e}")
+
+# === المطابقة الليلية للإحصائيات ===
+async def reconcile_statistics_job(context: ContextTypes.DEFAULT_TYPE):
+    drift = await reconcile_statistics()
+    if drift:
+        logging.warning(f"تم تصحيح عدّادات الإحصائيات: {drift}")
 
 # === معالجات رئيسية ===
 async def handle_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     uid = user.id
 
-    user_data = get_user_data(uid)
-    if user_data and user_data[7] == 1:
+    if uid in banned_users:
         await update.message.reply_text("🚫 تم حظرك من المسابقات نهائياً بسبب الغش.")
         return
 
@@ -299,51 +1471,42 @@ async def verify_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await q.answer()
     uid = q.from_user.id
 
-    user_data = get_user_data(uid)
-    if user_data and user_data[7] == 1:
+    if uid in banned_users:
         cheat_messages = [
             "🕵️‍♂️ اكتشاف محاولات غش متكررة!",
             "🤖 سلوكك يشبه البوتات. تم الحظر.",
             "🚫 تم حظرك بسبب تكرار الخروج والدخول."
         ]
-        await q.edit_message_text(random.choice(cheat_messages))
+        await edit_message(q, random.choice(cheat_messages))
         return
 
-    if await check_member(context, uid):
-        is_banned = increment_join_count(uid)
+    is_member = await get_membership(context, uid)
+    if is_member is None:
+        # خطأ مؤقت من تيليجرام لا يُسجَّل كمغادرة حتى لا تتراكم دورات خروج/دخول وهمية
+        await edit_message(q,
+            "⚠️ تعذر التحقق من اشتراكك الآن، حاول مرة أخرى بعد قليل.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔄 تحقق", callback_data="verify")]])
+        )
+        return
+
+    if is_member:
+        is_banned = record_membership_event(uid, 'join')
         if is_banned:
             cheat_messages = [
                 "🕵️‍♂️ اكتشاف محاولات غش متكررة!",
                 "🤖 سلوكك يشبه البوتات. تم الحظر.",
                 "🚫 تم حظرك بسبب تكرار الخروج والدخول."
             ]
-            await q.edit_message_text(random.choice(cheat_messages))
+            await edit_message(q, random.choice(cheat_messages))
             return
 
-        c = db_connection.cursor()
-        c.execute("SELECT referred_by, has_verified FROM users WHERE user_id = ?", (uid,))
-        row = c.fetchone()
-        if row:
-            ref_by = row[0]
-            already_verified = row[1]
-            if not already_verified:
-                c.execute("UPDATE users SET has_verified = 1 WHERE user_id = ?", (uid,))
-                db_connection.commit()
-
-                if ref_by and ref_by != uid:
-                    award_points(ref_by)
-                    try:
-                        ref_user = get_user_data(ref_by)
-                        if ref_user:
-                            current_points = ref_user[3]
-                            msg = f"🎉 تم انضمام شخص جديد من خلال رابطك!\nرصيدك الآن: {current_points} نقطة."
-                            await context.bot.send_message(ref_by, msg)
-                    except Exception as e:
-                        logging.error(f"فشل إرسال إشعار إحالة: {e}")
+        if complete_verification(uid):
+            wake_outbox(context)
 
         await show_menu(update, context)
     else:
-        await q.edit_message_text(
+        record_membership_event(uid, 'leave')
+        await edit_message(q,
             "❌ لست مشتركًا!",
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("انضم للقناة", url=CHANNEL_LINK)],
@@ -353,7 +1516,7 @@ async def verify_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    u = get_user_data(uid)
+    u = None if uid in banned_users else get_user_data(uid)
     if not u or u[7]:
         cheat_messages = [
             "🕵️‍♂️ اكتشاف محاولات غش متكررة!",
@@ -363,9 +1526,15 @@ async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.effective_message.reply_text(random.choice(cheat_messages))
         return
 
-    display_username = f"@{u[1]}" if u[1] != 'unknown' else "غير متوفر"
+    msg = render_main_menu(u)
+    if update.callback_query:
+        await edit_message(update.callback_query, msg, reply_markup=MAIN_MENU_KEYBOARD)
+    else:
+        await update.effective_message.reply_text(msg, reply_markup=MAIN_MENU_KEYBOARD)
 
-    msg = (
+def render_main_menu(u):
+    display_username = f"@{u[1]}" if u[1] != 'unknown' else "غير متوفر"
+    return (
         "✨ مرحباً بك في بوت العرين الذهبي للمسابقات ✨\n"
         "━━━━━━━━━━━━━━━━━━━━\n"
         f"👤 اسمك: {u[2]}\n"
@@ -377,34 +1546,18 @@ async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "━━━━━━━━━━━━━━━━━━━━\n"
         "🏆 حالتك: لم يتم استبعادك"
     )
-    kb = [
-        [InlineKeyboardButton("🏆 المسابقات الحالية", callback_data="view_active_contests")],
-        [InlineKeyboardButton("👤 ملفي", callback_data="view_profile")],
-        [InlineKeyboardButton("🛠️ الدعم الفني", callback_data="support"),
-         InlineKeyboardButton("💎 تجميع النقاط", callback_data="earn_points")]
-    ]
-    if update.callback_query:
-        await update.callback_query.edit_message_text(msg, reply_markup=InlineKeyboardMarkup(kb))
-    else:
-        await update.effective_message.reply_text(msg, reply_markup=InlineKeyboardMarkup(kb))
 
 # === 🌟 ملفي: يعرض نسبة مقارنة بالمتصدر ===
 async def view_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     uid = q.from_user.id
-    u = get_user_data(uid)
+    u = None if uid in banned_users else get_user_data(uid)
     if not u or u[7]:
-        await q.edit_message_text("🚫 تم حظرك من المسابقات نهائياً بسبب الغش.")
+        await edit_message(q, "🚫 تم حظرك من المسابقات نهائياً بسبب الغش.")
         return
 
-    user_points = u[3]
     leader_points = get_leader_points()
-    percentage = min(100.0, (user_points / leader_points) * 100)
-    bar_length = 10
-    filled = int((percentage / 100) * bar_length)
-    bar = "█" * filled + "░" * (bar_length - filled)
-
     c = db_connection.cursor()
     c.execute("""
         SELECT username, full_name, points 
@@ -412,9 +1565,19 @@ async def view_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
         WHERE user_id != ? AND banned = 0 AND points > ? 
         ORDER BY points ASC 
         LIMIT 1
-    """, (uid, user_points))
+    """, (uid, u[3]))
     next_competitor = c.fetchone()
-    competitor_msg = ""
+
+    profile_msg = render_profile(u, leader_points, next_competitor)
+    await edit_message(q, profile_msg, reply_markup=back_keyboard("back_main"))
+
+def render_profile(u, leader_points, next_competitor):
+    user_points = u[3]
+    percentage = min(100.0, (user_points / leader_points) * 100)
+    bar_length = 10
+    filled = int((percentage / 100) * bar_length)
+    bar = "█" * filled + "░" * (bar_length - filled)
+
     if next_competitor:
         diff = next_competitor[2] - user_points
         un = f"@{next_competitor[0]}" if next_competitor[0] != 'unknown' else next_competitor[1]
@@ -422,7 +1585,7 @@ async def view_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         competitor_msg = "\n🏆 أنت في الصدارة!"
 
-    profile_msg = (
+    return (
         f"👤 **ملفك الشخصي**\n"
         f"━━━━━━━━━━━━━━━━\n"
         f"الاسم: {u[2]}\n"
@@ -436,10 +1599,16 @@ async def view_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"{competitor_msg}"
     )
 
-    await q.edit_message_text(
-        profile_msg,
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_main")]])
-    )
+# === 🏅 لوحة الصدارة ===
+async def view_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    try:
+        page = max(1, min(int(q.data.split('_')[1]), LEADERBOARD_MAX_PAGES))
+    except (IndexError, ValueError):
+        page = 1
+    text, markup, _ = get_leaderboard_page(page)
+    await edit_message(q, text, reply_markup=markup)
 
 # === عرض تفاصيل المسابقة (للمستخدمين) ===
 async def view_contest_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -447,71 +1616,207 @@ async def view_contest_details(update: Update, context: ContextTypes.DEFAULT_TYP
     await q.answer()
     try:
         contest_id = int(q.data.split('_')[2])
-        contest = get_contest_by_id(contest_id)
-        if contest:
-            msg = f"📌 {contest[1]}\n\n{contest[2]}\n\n⏰ تنتهي: {contest[3]}"
-        else:
-            msg = "❌ لم يتم العثور على المسابقة."
+        contest_catalog()
+        msg, markup = _contest_details.get(contest_id, ("❌ لم يتم العثور على المسابقة.", CONTEST_DETAILS_BACK))
     except (IndexError, ValueError):
-        msg = "❌ خطأ في تحميل تفاصيل المسابقة."
-    await q.edit_message_text(
-        msg,
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_main")]])
-    )
-
-# === معالجات القوائم ===
-async def view_active_contests(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        msg, markup = "❌ خطأ في تحميل تفاصيل المسابقة.", CONTEST_DETAILS_BACK
+    await edit_message(q, msg, reply_markup=markup)
+
+# === قوائم المسابقات (رسالة واحدة بصفحات keyset) ===
+# كل عرض: الحالة، العنوان، نص القائمة الفارغة، زر الرجوع، سطر المسابقة، وأزرارها
+CONTEST_VIEWS = {
+    'ua': ('active', "🏆 المسابقات الحالية", "📭 لا توجد مسابقات حالياً.", "back_main",
+           lambda n, c: f"{n}. 📌 {c[1]}\n{c[2][:200]}\n⏰ تنتهي: {c[3]}",
+           lambda n, c: [[InlineKeyboardButton(f"{n}. {c[1]}", callback_data=f"view_contest_{c[0]}")]]),
+    'active': ('active', "📋 المسابقات النشطة", "📭 لا توجد مسابقات نشطة.", "manage_contests",
+               lambda n, c: f"{n}. ✅ {c[1]}\n{c[2][:200]}\n⏰ تنتهي: {c[3]}",
+               lambda n, c: [[InlineKeyboardButton(f"🗑️ {n}", callback_data=f"delete_{c[0]}"),
+                              InlineKeyboardButton(f"🚫 {n}", callback_data=f"cancel_{c[0]}"),
+                              InlineKeyboardButton(f"⏳ {n}", callback_data=f"postpone_{c[0]}")]]),
+    'postponed': ('postponed', "⏳ المسابقات المؤجلة", "<tool_call> لا توجد مسابقات مؤجلة.", "manage_contests",
+                  lambda n, c: f"{n}. ⏳ [مؤجلة] {c[1]}\n{c[2][:200]}\n⏰ تنتهي الآن: {c[3]}",
+                  lambda n, c: [[InlineKeyboardButton(f"⏹️ إنهاء التأجيل {n}", callback_data=f"resume_contest_{c[0]}")]]),
+    'finished': ('finished', "🏁 المسابقات المنتهية", "<tool_call> لا توجد مسابقات منتهية.", "manage_contests",
+                 lambda n, c: f"{n}. 🏁 [منتهية] {c[1]}\n{c[2][:200]}\n⏰ انتهت في: {c[3]}\n🏅 عدد الفائزين: {c[5]}",
+                 lambda n, c: [[InlineKeyboardButton(f"👁️ عرض الفائزين {n}", callback_data=f"view_winners_of_{c[0]}")]]),
+    'cancelled': ('cancelled', "❌ المسابقات الملغاة", "<tool_call> لا توجد مسابقات ملغاة.", "manage_contests",
+                  lambda n, c: f"{n}. ❌ [ملغاة] {c[1]}\n{c[2][:200]}\n⏰ كان ينتهي: {c[3]}",
+                  lambda n, c: []),
+    'winners': ('finished', "🎯 اختر مسابقة لإعلان فائزيها:", "<tool_call> لا توجد مسابقات منتهية لإعلان فائزين.", "back_admin",
+                None,
+                lambda n, c: [[InlineKeyboardButton(f"{c[1]} ({c[3][:10]})", callback_data=f"announce_winners_{c[0]}")]]),
+}
+
+# مؤشر الصفحة في callback_data: end_time مضغوط (YYYYmmddHHMM) + id
+def encode_contest_cursor(contest):
+    return f"{re.sub(r'[^0-9]', '', contest[3])}_{contest[0]}"
+
+def decode_contest_cursor(end_key, contest_id):
+    end = f"{end_key[0:4]}-{end_key[4:6]}-{end_key[6:8]} {end_key[8:10]}:{end_key[10:12]}"
+    return end, int(contest_id)
+
+# direction: 'n' = الصفحة بعد المؤشر، 'p' = الصفحة قبله. يعيد (الصفوف، هل توجد سابقة، هل توجد تالية)
+def fetch_contest_page(status, cursor=None, direction='n'):
+    catalog = contest_catalog()
+    rows = catalog['by_status'].get(status, [])
+    keys = catalog['keys'].get(status, [])
+    if cursor is None:
+        end = len(rows)
+        return rows[max(0, end - CONTEST_PAGE_SIZE):end][::-1], False, end > CONTEST_PAGE_SIZE
+    if direction == 'n':
+        end = bisect_left(keys, cursor)
+        start = max(0, end - CONTEST_PAGE_SIZE)
+        return rows[start:end][::-1], True, start > 0
+    start = bisect_right(keys, cursor)
+    end = start + CONTEST_PAGE_SIZE
+    return rows[start:end][::-1], end < len(rows), True
+
+# تُخزَّن الصفحة الأولى لكل عرض فقط: المؤشر يأتي من بيانات الزر التي يرسلها العميل،
+# وبقية الصفحات تُبنى من الفهرس في الذاكرة بكلفة bisect
+def render_contest_page(view, cursor=None, direction='n'):
+    contest_catalog()
+    if cursor is not None:
+        return build_contest_page(view, cursor, direction)
+    if view not in _contest_pages:
+        _contest_pages[view] = build_contest_page(view)
+    return _contest_pages[view]
+
+def build_contest_page(view, cursor=None, direction='n'):
+    status, title, empty_text, back, line, buttons = CONTEST_VIEWS[view]
+    rows, has_prev, has_next = fetch_contest_page(status, cursor, direction)
+    back_row = [InlineKeyboardButton("🔙 رجوع", callback_data=back)]
+    if not rows:
+        return empty_text, InlineKeyboardMarkup([back_row])
+
+    parts = [title]
+    kb = []
+    for n, contest in enumerate(rows, 1):
+        if line:
+            parts.append(line(n, contest))
+        kb.extend(buttons(n, contest))
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton("⬅️ السابق", callback_data=f"cpage_{view}_p_{encode_contest_cursor(rows[0])}"))
+    if has_next:
+        nav.append(InlineKeyboardButton("التالي ➡️", callback_data=f"cpage_{view}_n_{encode_contest_cursor(rows[-1])}"))
+    if nav:
+        kb.append(nav)
+    kb.append(back_row)
+    return "\n\n".join(parts), InlineKeyboardMarkup(kb)
+
+async def show_contest_page(update: Update, view, cursor=None, direction='n'):
     q = update.callback_query
     await q.answer()
-    contests = get_active_contests()
-    if not contests:
-        await q.edit_message_text(
-            "📭 لا توجد مسابقات حالياً.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_main")]])
-        )
+    text, markup = render_contest_page(view, cursor, direction)
+    await edit_message(q, text, reply_markup=markup)
+
+async def contest_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        _, view, direction, end_key, contest_id = update.callback_query.data.split('_')
+        if view not in CONTEST_VIEWS:
+            raise ValueError
+        cursor = decode_contest_cursor(end_key, contest_id)
+    except ValueError:
+        await update.callback_query.answer("❌ خيار غير معروف.")
         return
+    await show_contest_page(update, view, cursor, direction)
 
-    for contest in contests:
-        msg = f"📌 {contest[1]}\n{contest[2]}\n⏰ تنتهي: {contest[3]}"
-        kb = [[InlineKeyboardButton("🔙 رجوع", callback_data="back_main")]]
-        await q.message.reply_text(msg, reply_markup=InlineKeyboardMarkup(kb))
-    
-    await q.delete_message()
+# === معالجات القوائم ===
+async def view_active_contests(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await show_contest_page(update, 'ua')
 
 async def earn_points_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     uid = q.from_user.id
     ref_link = get_ref_link(uid)
-    await q.edit_message_text(
+    await edit_message(q,
         f"💎 كل إحالة ناجحة = {POINTS_PER_REFERRAL} نقاط!\n"
         f"🔗 رابطك: {ref_link}",
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_main")]])
+        reply_markup=back_keyboard("back_main")
     )
 
 async def support_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
-    await q.edit_message_text(
+    await edit_message(q,
         f"🛠️ للدعم الفني، راسل الأدمن: {ADMIN_USERNAME}",
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_main")]])
+        reply_markup=back_keyboard("back_main")
     )
 
+# === الوضع المضمّن: بطاقة الإحالة وترتيب المتصدرين ===
+# تيليجرام يرسل استعلامًا مع كل حرف يكتبه المستخدم، لذلك لا تعتمد النتائج على نص الاستعلام
+# وتُبنى مرة لكل مستخدم كل INLINE_CACHE_SECONDS. ومع cache_time وis_personal يعيد تيليجرام
+# النتائج نفسها لنفس المستخدم دون أن يسأل البوت أصلاً.
+_inline_state = {'built_at': 0.0, 'top': None}
+# user_id -> (وقت البناء، النتائج)
+_inline_results = OrderedDict()
+
+# نص الترتيب مشترك بين كل المستخدمين؛ يُبطل مع لوحة الصدارة أو بانتهاء المدة
+def inline_top_text():
+    now = time.monotonic()
+    if _inline_state['top'] is None or now - _inline_state['built_at'] > INLINE_CACHE_SECONDS:
+        rows = fetch_leaderboard_rows(None, INLINE_TOP_COUNT)
+        text = f"🏅 أفضل {INLINE_TOP_COUNT} في مسابقة العرين الذهبي\n━━━━━━━━━━━━━━━━\n"
+        if not rows:
+            text += "📭 لا يوجد مشاركون بعد."
+        for i, r in enumerate(rows, 1):
+            un = f"@{r[1]}" if r[1] != 'unknown' else r[2]
+            text += f"{i}. {un} — {r[3]} نقطة\n"
+        _inline_state['top'] = text
+        _inline_state['built_at'] = now
+    return _inline_state['top']
+
+def build_inline_results(uid):
+    u = get_user_data(uid)
+    ref_link = get_ref_link(uid)
+    join_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("🎁 شارك في المسابقة", url=ref_link)]])
+    card = "✨ انضم إلى مسابقة العرين الذهبي عبر رابطي واربح الجوائز!\n"
+    if u:
+        card += f"⭐ نقاطي: {u[3]} — ✅ إحالاتي: {u[4]}\n"
+    card += f"🔗 {ref_link}"
+    return [
+        InlineQueryResultArticle(
+            id="ref_card",
+            title="🎁 بطاقة الإحالة",
+            description=f"⭐ {u[3]} نقطة — أرسل رابطك لأصدقائك" if u else "أرسل رابطك لأصدقائك",
+            input_message_content=InputTextMessageContent(card),
+            reply_markup=join_keyboard
+        ),
+        InlineQueryResultArticle(
+            id="top",
+            title=f"🏅 أفضل {INLINE_TOP_COUNT}",
+            description="الترتيب الحالي للمسابقة",
+            input_message_content=InputTextMessageContent(inline_top_text()),
+            reply_markup=join_keyboard
+        )
+    ]
+
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    iq = update.inline_query
+    uid = iq.from_user.id
+    if uid in banned_users:
+        await iq.answer([], cache_time=INLINE_CACHE_SECONDS, is_personal=True)
+        return
+    now = time.monotonic()
+    cached = _inline_results.get(uid)
+    if cached is None or now - cached[0] > INLINE_CACHE_SECONDS:
+        cached = (now, build_inline_results(uid))
+        _inline_results[uid] = cached
+        if len(_inline_results) > INLINE_CACHE_USERS:
+            _inline_results.popitem(last=False)
+    _inline_results.move_to_end(uid)
+    await iq.answer(cached[1], cache_time=INLINE_CACHE_SECONDS, is_personal=True)
+
 # === معالجات الأدمن ===
 async def show_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS:
         await update.effective_message.reply_text("🚫 غير مصرح لك.")
         return
-    kb = [
-        [InlineKeyboardButton("📢 إدارة المسابقات", callback_data="manage_contests")],
-        [InlineKeyboardButton("📊 الإحصائيات", callback_data="view_statistics")],
-        [InlineKeyboardButton("🛡️ مكافحة الغش", callback_data="anti_cheat_menu")],
-        [InlineKeyboardButton("🏅 إدارة الفائزين", callback_data="manage_winners")],
-    ]
     if update.callback_query:
-        await update.callback_query.edit_message_text("👑 لوحة الأدمن", reply_markup=InlineKeyboardMarkup(kb))
+        await edit_message(update.callback_query, "👑 لوحة الأدمن", reply_markup=ADMIN_PANEL_KEYBOARD)
     else:
-        await update.effective_message.reply_text("👑 لوحة الأدمن", reply_markup=InlineKeyboardMarkup(kb))
+        await update.effective_message.reply_text("👑 لوحة الأدمن", reply_markup=ADMIN_PANEL_KEYBOARD)
 
 async def manage_contests(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -524,50 +1829,18 @@ async def manage_contests(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("❌ الملغاة", callback_data="view_cancelled_contests")],
         [InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]
     ]
-    await q.edit_message_text("📁 إدارة المسابقات", reply_markup=InlineKeyboardMarkup(kb))
+    await edit_message(q, "📁 إدارة المسابقات", reply_markup=InlineKeyboardMarkup(kb))
 
 async def view_active_contests_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    contests = get_active_contests()
-    if not contests:
-        await q.edit_message_text(
-            "📭 لا توجد مسابقات نشطة.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]])
-        )
-        return
-    for contest in contests:
-        msg = f"✅ {contest[1]}\n{contest[2]}\n⏰ تنتهي: {contest[3]}"
-        kb = [
-            [InlineKeyboardButton("🗑️ حذف", callback_data=f"delete_{contest[0]}"),
-             InlineKeyboardButton("🚫 إلغاء", callback_data=f"cancel_{contest[0]}")],
-            [InlineKeyboardButton("⏳ تأجيل", callback_data=f"postpone_{contest[0]}")],
-            [InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]
-        ]
-        await q.message.reply_text(msg, reply_markup=InlineKeyboardMarkup(kb))
-    await q.delete_message()
+    await show_contest_page(update, 'active')
 
 async def view_cancelled_contests(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    c = db_connection.cursor()
-    c.execute("SELECT * FROM contests WHERE status = 'cancelled'")
-    contests = c.fetchall()
-    if not contests:
-        await q.edit_message_text(
-            "<tool_call> لا توجد مسابقات ملغاة.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]])
-        )
-        return
-    for contest in contests:
-        msg = f"❌ [ملغاة] {contest[1]}\n{contest[2]}\n⏰ كان ينتهي: {contest[3]}"
-        await q.message.reply_text(msg)
-    await q.edit_message_text("عرض المسابقات الملغاة.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]]))
+    await show_contest_page(update, 'cancelled')
 
 async def new_contest_step1(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
-    await q.edit_message_text("أرسل وصف المسابقة الكامل:")
+    await edit_message(q, "أرسل وصف المسابقة الكامل:")
     context.user_data['admin_step'] = 'desc'
 
 async def handle_desc_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -585,10 +1858,10 @@ async def handle_unit_selection(update: Update, context: ContextTypes.DEFAULT_TY
     await q.answer()
     if q.data == "unit_hours":
         context.user_data['unit'] = 'hours'
-        await q.edit_message_text("أدخل عدد الساعات:")
+        await edit_message(q, "أدخل عدد الساعات:")
     else:
         context.user_data['unit'] = 'days'
-        await q.edit_message_text("أدخل عدد الأيام:")
+        await edit_message(q, "أدخل عدد الأيام:")
     context.user_data['admin_step'] = 'duration'
 
 async def handle_duration_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -652,7 +1925,7 @@ async def handle_winner_count_input(update: Update, context: ContextTypes.DEFAUL
         
         await update.message.reply_text(
             f"✅ تم نشر المسابقة!\nعدد الفائزين: {winner_count}",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع للوحة التحكم", callback_data="back_admin")]])
+            reply_markup=back_keyboard("back_admin", "🔙 رجوع للوحة التحكم")
         )
     except Exception as e:
         logging.error(f"Error in winner count input: {e}")
@@ -671,7 +1944,7 @@ async def handle_postpone_step1(update: Update, context: ContextTypes.DEFAULT_TY
         [InlineKeyboardButton("⏱️ بالساعات", callback_data="postpone_unit_hours")],
         [InlineKeyboardButton("📅 بالأيام", callback_data="postpone_unit_days")]
     ]
-    await q.edit_message_text("كم تريد التأجيل؟", reply_markup=InlineKeyboardMarkup(kb))
+    await edit_message(q, "كم تريد التأجيل؟", reply_markup=InlineKeyboardMarkup(kb))
 
 async def handle_postpone_unit_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -679,7 +1952,7 @@ async def handle_postpone_unit_selection(update: Update, context: ContextTypes.D
     unit = 'hours' if 'hours' in q.data else 'days'
     context.user_data['postpone_unit'] = unit
     msg = "أدخل عدد الساعات:" if unit == 'hours' else "أدخل عدد الأيام:"
-    await q.edit_message_text(msg)
+    await edit_message(q, msg)
     context.user_data['admin_step'] = 'postpone_duration'
 
 async def handle_postpone_duration_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -710,12 +1983,13 @@ async def handle_postpone_duration_input(update: Update, context: ContextTypes.D
         c = db_connection.cursor()
         c.execute("UPDATE contests SET end_time = ?, status = 'postponed' WHERE id = ?", (new_end_str, contest_id))
         db_connection.commit()
+        bump_contest_version()
 
         await broadcast(context, msg_to_users)
 
         await update.message.reply_text(
             f"✅ تم التأجيل بنجاح حتى {new_end_str}.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع للوحة التحكم", callback_data="back_admin")]])
+            reply_markup=back_keyboard("back_admin", "🔙 رجوع للوحة التحكم")
         )
     except:
         await update.message.reply_text("❌ أدخل رقمًا صحيحًا.")
@@ -723,27 +1997,7 @@ async def handle_postpone_duration_input(update: Update, context: ContextTypes.D
         context.user_data.clear()
 
 async def view_postponed_contests(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    c = db_connection.cursor()
-    c.execute("SELECT * FROM contests WHERE status = 'postponed'")
-    contests = c.fetchall()
-    
-    if not contests:
-        await q.edit_message_text(
-            "<tool_call> لا توجد مسابقات مؤجلة.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]])
-        )
-        return
-
-    for contest in contests:
-        msg = f"⏳ [مؤجلة] {contest[1]}\n{contest[2]}\n⏰ تنتهي الآن: {contest[3]}"
-        kb = [
-            [InlineKeyboardButton("⏹️ إنهاء التأجيل", callback_data=f"resume_contest_{contest[0]}")],
-            [InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]
-        ]
-        await q.message.reply_text(msg, reply_markup=InlineKeyboardMarkup(kb))
-    await q.delete_message()
+    await show_contest_page(update, 'postponed')
 
 async def resume_contest(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -751,34 +2005,14 @@ async def resume_contest(update: Update, context: ContextTypes.DEFAULT_TYPE):
     contest_id = int(q.data.split('_')[2])
     update_contest_status(contest_id, 'active')
     await broadcast(context, "▶️ تم استئناف المسابقة!")
-    await q.edit_message_text(
+    await edit_message(q,
         "✅ تم إنهاء التأجيل واستئناف المسابقة.",
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]])
+        reply_markup=back_keyboard("manage_contests")
     )
 
 # === المسابقات المنتهية ===
 async def view_finished_contests(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    c = db_connection.cursor()
-    c.execute("SELECT * FROM contests WHERE status = 'finished' ORDER BY end_time DESC")
-    contests = c.fetchall()
-    
-    if not contests:
-        await q.edit_message_text(
-            "<tool_call> لا توجد مسابقات منتهية.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]])
-        )
-        return
-
-    for contest in contests:
-        msg = f"🏁 [منتهية] {contest[1]}\n{contest[2]}\n⏰ انتهت في: {contest[3]}\n🏅 عدد الفائزين: {contest[5]}"
-        kb = [
-            [InlineKeyboardButton("👁️ عرض الفائزين", callback_data=f"view_winners_of_{contest[0]}")],
-            [InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]
-        ]
-        await q.message.reply_text(msg, reply_markup=InlineKeyboardMarkup(kb))
-    await q.delete_message()
+    await show_contest_page(update, 'finished')
 
 async def view_winners_of_contest(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -793,9 +2027,9 @@ async def view_winners_of_contest(update: Update, context: ContextTypes.DEFAULT_
         winners = get_winners(winner_count)
         
         if not winners:
-            await q.edit_message_text(
+            await edit_message(q,
                 "<tool_call> لا يوجد فائزون مسجلون.",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]])
+                reply_markup=back_keyboard("manage_contests")
             )
             return
 
@@ -804,37 +2038,19 @@ async def view_winners_of_contest(update: Update, context: ContextTypes.DEFAULT_
             un = f"@{w[1]}" if w[1] != 'unknown' else "غير متوفر"
             msg += f"{i}. {w[2]} ({un}) — النقاط: {w[3]}\n"
 
-        await q.edit_message_text(
+        await edit_message(q,
             msg,
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]])
+            reply_markup=back_keyboard("manage_contests")
         )
     except:
-        await q.edit_message_text(
+        await edit_message(q,
             "❌ خطأ في تحميل الفائزين.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]])
+            reply_markup=back_keyboard("manage_contests")
         )
 
 # === ⭐ إدارة الفائزين ===
 async def manage_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    c = db_connection.cursor()
-    c.execute("SELECT id, title, end_time, winner_count FROM contests WHERE status = 'finished' ORDER BY end_time DESC")
-    contests = c.fetchall()
-    
-    if not contests:
-        await q.edit_message_text(
-            "<tool_call> لا توجد مسابقات منتهية لإعلان فائزين.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]])
-        )
-        return
-
-    kb = []
-    for contest in contests:
-        kb.append([InlineKeyboardButton(f"{contest[1]} ({contest[2][:10]})", callback_data=f"announce_winners_{contest[0]}")])
-    kb.append([InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")])
-    
-    await q.edit_message_text("🎯 اختر مسابقة لإعلان فائزيها:", reply_markup=InlineKeyboardMarkup(kb))
+    await show_contest_page(update, 'winners')
 
 async def announce_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -843,14 +2059,14 @@ async def announce_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
         contest_id = int(q.data.split('_')[2])
         contest = get_contest_by_id(contest_id)
         if not contest or contest[4] != 'finished':
-            await q.edit_message_text("❌ هذه المسابقة غير منتهية.")
+            await edit_message(q, "❌ هذه المسابقة غير منتهية.")
             return
 
         winner_count = contest[5]
         winners = get_winners(winner_count)
 
         if not winners:
-            await q.edit_message_text("<tool_call> لا يوجد مستخدمون مؤهلون للفوز.")
+            await edit_message(q, "<tool_call> لا يوجد مستخدمون مؤهلون للفوز.")
             return
 
         msg = f"🏆 فائزون في: {contest[1]}\n(إجمالي: {winner_count} فائز)\n\n"
@@ -866,10 +2082,10 @@ async def announce_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]
         context.user_data['current_winner_ids'] = winner_ids
         context.user_data['current_contest_id'] = contest_id
-        await q.edit_message_text(msg, reply_markup=InlineKeyboardMarkup(kb))
+        await edit_message(q, msg, reply_markup=InlineKeyboardMarkup(kb))
     except Exception as e:
         logging.error(f"خطأ في announce_winners: {e}")
-        await q.edit_message_text("❌ خطأ في تحميل الفائزين.")
+        await edit_message(q, "❌ خطأ في تحميل الفائزين.")
 
 async def notify_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -878,7 +2094,7 @@ async def notify_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
     winner_ids = context.user_data.get('current_winner_ids', [])
     
     if not contest_id or not winner_ids:
-        await q.edit_message_text("❌ لا توجد بيانات كافية.")
+        await edit_message(q, "❌ لا توجد بيانات كافية.")
         return
 
     for uid in winner_ids:
@@ -887,10 +2103,7 @@ async def notify_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except:
             pass
 
-    placeholders = ','.join('?' * len(winner_ids))
-    c = db_connection.cursor()
-    c.execute(f"SELECT user_id FROM users WHERE banned = 0 AND user_id NOT IN ({placeholders})", winner_ids)
-    non_winners = [row[0] for row in c.fetchall()]
+    non_winners = broadcast_recipients(exclude=winner_ids)
 
     winners = get_winners(len(winner_ids))
     winners_text = "🏆 تم اختيار الفائزين في المسابقة الأخيرة:\n\n"
@@ -898,14 +2111,18 @@ async def notify_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
         un = f"@{w[1]}" if w[1] != 'unknown' else w[2]
         winners_text += f"{i}. {un}\n"
 
+    unreachable = []
     for uid in non_winners:
         try:
             await context.bot.send_message(uid, winners_text)
+        except Forbidden:
+            unreachable.append(uid)
         except:
             pass
+    mark_unreachable(unreachable)
 
-    await q.edit_message_text("✅ تم إرسال إشعارات الفائزين بنجاح!", 
-                              reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="manage_winners")]]))
+    await edit_message(q, "✅ تم إرسال إشعارات الفائزين بنجاح!", 
+                              reply_markup=back_keyboard("manage_winners"))
 
 # === الفائزين (من الأدمن) ===
 async def show_winners_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -913,8 +2130,8 @@ async def show_winners_admin(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await q.answer()
     contests = get_all_contests()
     if not contests:
-        await q.edit_message_text("<tool_call> لا توجد مسابقات.", 
-                                  reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]]))
+        await edit_message(q, "<tool_call> لا توجد مسابقات.", 
+                                  reply_markup=back_keyboard("back_admin"))
         return
     
     latest_contest = contests[-1]
@@ -925,8 +2142,8 @@ async def show_winners_admin(update: Update, context: ContextTypes.DEFAULT_TYPE)
     winners = get_winners(winner_count)
     
     if not winners:
-        await q.edit_message_text("<tool_call> لا يوجد مستخدمون مؤهلون.", 
-                                  reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]]))
+        await edit_message(q, "<tool_call> لا يوجد مستخدمون مؤهلون.", 
+                                  reply_markup=back_keyboard("back_admin"))
         return
     
     msg = f"🏆 الفائزون (أفضل {winner_count}):\n\n"
@@ -939,7 +2156,7 @@ async def show_winners_admin(update: Update, context: ContextTypes.DEFAULT_TYPE)
         [InlineKeyboardButton("🏆 إرسال: من هم الفائزون؟", callback_data="send_winners_q")],
         [InlineKeyboardButton("🔙 رجوع للوحة التحكم", callback_data="back_admin")]
     ]
-    await q.edit_message_text(msg, reply_markup=InlineKeyboardMarkup(kb))
+    await edit_message(q, msg, reply_markup=InlineKeyboardMarkup(kb))
 
 async def send_winners_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -947,7 +2164,7 @@ async def send_winners_question(update: Update, context: ContextTypes.DEFAULT_TY
     
     contests = get_all_contests()
     if not contests:
-        await q.edit_message_text("<tool_call> لا توجد مسابقات.")
+        await edit_message(q, "<tool_call> لا توجد مسابقات.")
         return
     
     latest_contest = contests[-1]
@@ -956,7 +2173,7 @@ async def send_winners_question(update: Update, context: ContextTypes.DEFAULT_TY
     
     if not winners:
         await broadcast(context, "🏅 لم يتم تحديد فائزون بعد.")
-        await q.edit_message_text("✅ تم الإرسال.")
+        await edit_message(q, "✅ تم الإرسال.")
         return
     
     winners_list = []
@@ -967,29 +2184,31 @@ async def send_winners_question(update: Update, context: ContextTypes.DEFAULT_TY
     
     winners_text = "🏆 الفائزون:\n\n" + "\n".join(winners_list)
     
-    cursor = db_connection.cursor()
-    cursor.execute("SELECT user_id FROM users WHERE banned = 0")
-    for (user_id,) in cursor.fetchall():
+    unreachable = []
+    for user_id in broadcast_recipients():
         try:
             if user_id in winner_ids:
                 await context.bot.send_message(user_id, "🎉 أنت من الفائزين! تهانينا 🏆")
             else:
                 await context.bot.send_message(user_id, winners_text)
+        except Forbidden:
+            unreachable.append(user_id)
         except:
             pass
+    mark_unreachable(unreachable)
     
-    await q.edit_message_text(
+    await edit_message(q,
         "✅ تم إرسال قائمة الفائزين لجميع المستخدمين.",
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]])
+        reply_markup=back_keyboard("back_admin")
     )
 
 async def send_contest_ended(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     await broadcast(context, "🏆 تم إنهاء المسابقة! شكرًا للمشاركة.")
-    await q.edit_message_text(
+    await edit_message(q,
         "✅ تم الإرسال.",
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]])
+        reply_markup=back_keyboard("back_admin")
     )
 
 # === الإحصائيات ===
@@ -1005,9 +2224,53 @@ async def view_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"⭐ إجمالي النقاط: {stats['total_points']}\n"
         f"🏆 عدد المسابقات: {stats['total_contests']}"
     )
-    await q.edit_message_text(
+    await edit_message(q,
+        msg,
+        reply_markup=back_keyboard("back_admin")
+    )
+
+# === تصدير البيانات (للأدمن) ===
+async def export_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    kb = [
+        [InlineKeyboardButton("👥 المستخدمون CSV", callback_data="export_users_csv"),
+         InlineKeyboardButton("JSONL", callback_data="export_users_jsonl")],
+        [InlineKeyboardButton("🏆 الترتيب CSV", callback_data="export_leaderboard_csv"),
+         InlineKeyboardButton("JSONL", callback_data="export_leaderboard_jsonl")],
+        [InlineKeyboardButton("🕵️ سجل الغش CSV", callback_data="export_cheat_logs_csv"),
+         InlineKeyboardButton("JSONL", callback_data="export_cheat_logs_jsonl")],
+        [InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]
+    ]
+    await edit_message(q, "📤 اختر البيانات المراد تصديرها:", reply_markup=InlineKeyboardMarkup(kb))
+
+async def export_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    if q.from_user.id not in ADMIN_IDS:
+        return
+    kind, fmt = q.data[len("export_"):].rsplit('_', 1)
+    if kind not in EXPORT_QUERIES or fmt not in ('csv', 'jsonl'):
+        await edit_message(q, "❌ خيار غير معروف.")
+        return
+
+    await edit_message(q, "⏳ جارِ تجهيز الملف...")
+    path = None
+    try:
+        path = await asyncio.to_thread(export_to_file, kind, fmt)
+        filename = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}.gz"
+        with open(path, 'rb') as f:
+            await context.bot.send_document(q.from_user.id, document=f, filename=filename)
+        msg = "✅ تم إرسال الملف."
+    except Exception as e:
+        logging.error(f"فشل التصدير ({kind}/{fmt}): {e}")
+        msg = "❌ فشل التصدير."
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+    await edit_message(q,
         msg,
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]])
+        reply_markup=back_keyboard("export_menu")
     )
 
 # === تصفير النقاط ===
@@ -1018,7 +2281,7 @@ async def reset_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("نعم", callback_data="do_reset"),
          InlineKeyboardButton("لا", callback_data="back_admin")]
     ]
-    await q.edit_message_text(
+    await edit_message(q,
         "⚠️ تأكيد تصفير النقاط؟",
         reply_markup=InlineKeyboardMarkup(kb)
     )
@@ -1028,20 +2291,116 @@ async def do_reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await q.answer()
     reset_points()
     await broadcast(context, "🧹 تم تصفير النقاط.")
-    await q.edit_message_text(
+    await edit_message(q,
         "✅ تم التصفير.",
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]])
+        reply_markup=back_keyboard("back_admin")
     )
 
 # === إدارة الغش ===
 async def anti_cheat_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
-    kb = [
-        [InlineKeyboardButton("👁️ عرض السجل", callback_data="view_cheat_logs")],
-        [InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]
-    ]
-    await q.edit_message_text("🛡️ لوحة مكافحة الغش", reply_markup=InlineKeyboardMarkup(kb))
+    await edit_message(q, "🛡️ لوحة مكافحة الغش", reply_markup=ANTI_CHEAT_KEYBOARD)
+
+# === البث الموجّه ===
+SEGMENT_MENU_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(label, callback_data=f"segment_{key}")] for key, label in AUDIENCE_SEGMENTS.items()]
+    + [[InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]]
+)
+
+async def segment_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    if q.from_user.id not in ADMIN_IDS:
+        return
+    await edit_message(q, "📣 اختر الشريحة المستهدفة:", reply_markup=SEGMENT_MENU_KEYBOARD)
+
+async def segment_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    if q.from_user.id not in ADMIN_IDS:
+        return
+    segment = q.data[len("segment_"):]
+    if segment not in AUDIENCE_SEGMENTS:
+        await edit_message(q, "❌ خيار غير معروف.")
+        return
+    context.user_data['segment'] = segment
+    context.user_data['segment_arg'] = None
+    if segment in SEGMENT_ARGS:
+        context.user_data['admin_step'] = 'segment_arg'
+        await edit_message(q, SEGMENT_ARGS[segment], reply_markup=back_keyboard("segment_menu"))
+        return
+    context.user_data['admin_step'] = 'segment_message'
+    await edit_message(q, segment_preview(segment), reply_markup=back_keyboard("segment_menu"))
+
+def segment_preview(segment, arg=None):
+    return (f"{AUDIENCE_SEGMENTS[segment]}\n"
+            f"👥 عدد المستلمين: {len(segment_members(segment, arg))}\n\n"
+            "✍️ أرسل نص الرسالة:")
+
+async def handle_segment_arg_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        arg = int(update.message.text.strip())
+        if arg <= 0:
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text("❌ أدخل رقمًا صحيحًا.")
+        return
+    context.user_data['segment_arg'] = arg
+    context.user_data['admin_step'] = 'segment_message'
+    await update.message.reply_text(segment_preview(context.user_data['segment'], arg),
+                                    reply_markup=back_keyboard("segment_menu"))
+
+async def handle_segment_message_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data['admin_step'] = None
+    recipients = segment_members(context.user_data['segment'], context.user_data.get('segment_arg'))
+    sent = await broadcast(context, update.message.text, recipients=recipients)
+    await update.message.reply_text(
+        f"✅ تم الإرسال إلى {sent} من أصل {len(recipients)}.",
+        reply_markup=back_keyboard("back_admin", "🔙 رجوع للوحة التحكم")
+    )
+
+# === العمليات الجماعية ===
+async def bulk_action_step1(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    context.user_data['admin_step'] = q.data
+    await edit_message(q,
+        "📎 أرسل ملفًا نصيًا أو CSV يحتوي معرفًا واحدًا في كل سطر (العمود الأول).\n"
+        "للاستيراد يمكن إضافة اليوزر والاسم كعمودين إضافيين.",
+        reply_markup=back_keyboard("anti_cheat_menu")
+    )
+
+async def handle_bulk_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    step = context.user_data.get('admin_step', '')
+    action = step[len("bulk_"):]
+    if action not in BULK_ACTIONS:
+        return
+    context.user_data.clear()
+
+    status = await update.message.reply_text("⏳ جارِ تنزيل الملف...")
+    fd, path = tempfile.mkstemp(suffix=".ids")
+    os.close(fd)
+    try:
+        tg_file = await update.message.document.get_file()
+        await tg_file.download_to_drive(path)
+
+        async def progress(stats):
+            await status.edit_text(f"⏳ تمت معالجة {stats['read']} معرف...")
+
+        stats = await run_bulk_action(action, path, progress)
+        await status.edit_text(
+            f"✅ اكتملت العملية.\n"
+            f"📄 المعرفات المقروءة: {stats['read']}\n"
+            f"✏️ السجلات المعدلة: {stats['changed']}\n"
+            f"⏭️ الأسطر المتجاهلة: {stats['skipped']}",
+            reply_markup=back_keyboard("anti_cheat_menu")
+        )
+    except Exception as e:
+        logging.error(f"فشل العملية الجماعية ({action}): {e}")
+        await status.edit_text("❌ فشلت معالجة الملف.")
+    finally:
+        os.remove(path)
 
 async def view_cheat_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -1050,17 +2409,17 @@ async def view_cheat_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     c.execute("SELECT * FROM cheat_logs ORDER BY detected_at DESC LIMIT 20")
     logs = c.fetchall()
     if not logs:
-        await q.edit_message_text(
+        await edit_message(q,
             "✅ لا توجد سجلات غش.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="anti_cheat_menu")]])
+            reply_markup=back_keyboard("anti_cheat_menu")
         )
         return
     msg = "⚠️ سجل محاولات الغش الأخيرة:\n\n"
     for log in logs:
         msg += f"📅 {log[4][:16]} | {log[1]} ↔ {log[2]}\n"
-    await q.edit_message_text(
+    await edit_message(q,
         msg,
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="anti_cheat_menu")]])
+        reply_markup=back_keyboard("anti_cheat_menu")
     )
 
 # === معالجة الإجراءات على المسابقات ===
@@ -1074,6 +2433,7 @@ async def handle_contest_action(update: Update, context: ContextTypes.DEFAULT_TY
         c = db_connection.cursor()
         c.execute("DELETE FROM contests WHERE id = ?", (contest_id,))
         db_connection.commit()
+        bump_contest_version()
         msg = "🗑️ تم حذف المسابقة."
     elif 'cancel' in data:
         update_contest_status(contest_id, 'cancelled')
@@ -1081,11 +2441,81 @@ async def handle_contest_action(update: Update, context: ContextTypes.DEFAULT_TY
     else:
         msg = "❌ خيار غير معروف."
     
-    await q.edit_message_text(
+    await edit_message(q,
         msg,
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 رجوع", callback_data="manage_contests")]])
+        reply_markup=back_keyboard("manage_contests")
     )
 
+# === التشخيص (تحليل الأداء والذاكرة) ===
+async def diagnostics_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    if q.from_user.id not in ADMIN_IDS:
+        return
+    kb = [
+        [InlineKeyboardButton(f"⏱️ تحليل الأداء ({PROFILE_SECONDS} ث)", callback_data="diag_cpu")],
+        [InlineKeyboardButton(f"🧠 لقطة الذاكرة ({PROFILE_SECONDS} ث)", callback_data="diag_mem")],
+        [InlineKeyboardButton("🧮 إعادة حساب النقاط", callback_data="repair_points")],
+        [InlineKeyboardButton("🔙 رجوع", callback_data="back_admin")]
+    ]
+    await edit_message(q, "🔬 التشخيص", reply_markup=InlineKeyboardMarkup(kb))
+
+async def start_diagnostics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    if q.from_user.id not in ADMIN_IDS:
+        return
+    kind = q.data[len("diag_"):]
+    started = profiling.start_cpu_profile(PROFILE_SECONDS) if kind == 'cpu' else profiling.start_memory_trace()
+    if not started:
+        msg = "⚠️ توجد جلسة تشخيص قيد التشغيل بالفعل."
+    else:
+        context.job_queue.run_once(finish_diagnostics, when=PROFILE_SECONDS,
+                                   data={'kind': kind, 'chat_id': q.from_user.id})
+        msg = f"⏳ بدأ التشخيص، سيصلك التقرير بعد {PROFILE_SECONDS} ثانية."
+    await edit_message(q,
+        msg,
+        reply_markup=back_keyboard("diagnostics_menu")
+    )
+
+# يعمل في الخلفية ويرسل النتيجة للأدمن حتى لا ينتظر المعالج انتهاء الفحص
+async def repair_points_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    if q.from_user.id not in ADMIN_IDS:
+        return
+    context.application.create_task(report_points_repair(context.bot, q.from_user.id))
+    await edit_message(q,
+        "⏳ بدأت إعادة حساب النقاط، ستصلك النتيجة عند الانتهاء.",
+        reply_markup=back_keyboard("diagnostics_menu")
+    )
+
+async def report_points_repair(bot, chat_id):
+    try:
+        result = await repair_points()
+        if not result['applied']:
+            msg = (f"🧮 مستخدمون بقيم مختلفة: {result['drift']}\n"
+                   "ℹ️ لم يُطبّق أي إصلاح: يبدأ الإصلاح بعد أول تصفير للنقاط.")
+        else:
+            msg = (f"🧮 مستخدمون بقيم مختلفة: {result['drift']}\n"
+                   f"✅ تم الإصلاح: {result['fixed']}\n"
+                   f"⏭️ تغيّرت أثناء الفحص (تُعاد لاحقًا): {result['skipped']}")
+    except Exception as e:
+        logging.error(f"فشل إصلاح النقاط: {e}")
+        msg = "❌ فشلت إعادة حساب النقاط."
+    await bot.send_message(chat_id, msg)
+
+async def finish_diagnostics(context: ContextTypes.DEFAULT_TYPE):
+    kind = context.job.data['kind']
+    if kind == 'cpu':
+        report = profiling.stop_cpu_profile()
+    else:
+        report = await asyncio.to_thread(profiling.stop_memory_trace)
+    if not report:
+        return
+    filename = f"{'profile' if kind == 'cpu' else 'memory'}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    await context.bot.send_document(context.job.data['chat_id'], document=report.encode('utf-8'), filename=filename)
+
 # === معالجات العودة ===
 async def back_main_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await show_menu(update, context)
@@ -1095,6 +2525,17 @@ async def back_admin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 # === معالج الأزرار الرئيسي ===
 async def button_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = profiling.active()
+    if session is None:
+        await dispatch_button(update, context)
+        return
+    t0 = time.perf_counter()
+    try:
+        await dispatch_button(update, context)
+    finally:
+        session.record(profiling.handler_key(update.callback_query.data), time.perf_counter() - t0)
+
+async def dispatch_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     data = q.data
 
@@ -1116,6 +2557,15 @@ async def button_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data == "manage_winners":
         await manage_winners(update, context)
         return
+    elif data == "export_menu":
+        await export_menu(update, context)
+        return
+    elif data == "diagnostics_menu":
+        await diagnostics_menu(update, context)
+        return
+    elif data == "segment_menu":
+        await segment_menu(update, context)
+        return
 
     handlers = {
         "verify": verify_handler,
@@ -1134,6 +2584,7 @@ async def button_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "send_ended": send_contest_ended,
         "send_winners_q": send_winners_question,
         "view_statistics": view_statistics,
+        "repair_points": repair_points_handler,
         "view_postponed_contests": view_postponed_contests,
         "view_finished_contests": view_finished_contests,
     }
@@ -1159,6 +2610,24 @@ async def button_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data.startswith("notify_winners_"):
         await notify_winners(update, context)
         return
+    elif data.startswith("cpage_"):
+        await contest_page_handler(update, context)
+        return
+    elif data.startswith("leaderboard_"):
+        await view_leaderboard(update, context)
+        return
+    elif data.startswith("bulk_"):
+        await bulk_action_step1(update, context)
+        return
+    elif data.startswith("diag_"):
+        await start_diagnostics(update, context)
+        return
+    elif data.startswith("segment_"):
+        await segment_selected(update, context)
+        return
+    elif data.startswith("export_"):
+        await export_data(update, context)
+        return
     elif data.startswith(("delete_", "cancel_")):
         await handle_contest_action(update, context)
         return
@@ -1182,25 +2651,74 @@ async def handle_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await handle_winner_count_input(update, context)
     elif step == 'postpone_duration':
         await handle_postpone_duration_input(update, context)
+    elif step == 'segment_arg':
+        await handle_segment_arg_input(update, context)
+    elif step == 'segment_message':
+        await handle_segment_message_input(update, context)
 
 # === التشغيل ===
-def main():
-    logging.basicConfig(level=logging.WARNING)
-    app = Application.builder().token(BOT_TOKEN).build()
+# === تسجيل التحديثات لإعادة التشغيل (يُفعَّل فقط عند ضبط RECORD_UPDATES_DIR) ===
+update_recorder = None
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        update_recorder.write(update.to_dict())
+    except Exception as e:
+        logging.error(f"فشل تسجيل التحديث: {e}")
+
+# base_url يسمح بتوجيه البوت إلى خادم Bot API محلي (يستخدمه replay.py)
+# request: عميل HTTP لطلبات البوت (غير getUpdates)؛ tenants.py يمرر عميلاً مشتركًا بين البوتات
+def build_application(token=BOT_TOKEN, base_url=None, request=None):
+    global update_recorder
+    open_database()
+    builder = Application.builder().token(token).post_init(start_warmup).post_shutdown(flush_on_shutdown)
+    if base_url:
+        builder = builder.base_url(base_url)
+    if request:
+        builder = builder.request(request)
+    app = builder.build()
 
     # معالج أخطاء
     async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+        runtime_counters['errors'] += 1
         logging.error("Exception while handling an update:", exc_info=context.error)
     app.add_error_handler(error_handler)
 
+    if config.RECORD_UPDATES_DIR:
+        update_recorder = recorder.RecordWriter(config.RECORD_UPDATES_DIR, config.RECORD_MAX_BYTES,
+                                                config.RECORD_SCRUB_KEY or BOT_TOKEN)
+        app.add_handler(TypeHandler(Update, record_update), group=-2)
+
+    load_recent_updates()
+    app.add_handler(TypeHandler(Update, dedup_update), group=-1)
     app.add_handler(CommandHandler("start", handle_start))
     app.add_handler(MessageHandler(filters.TEXT & filters.User(user_id=list(ADMIN_IDS)), handle_admin_text))
+    app.add_handler(MessageHandler(filters.Document.ALL & filters.User(user_id=list(ADMIN_IDS)), handle_bulk_document))
     app.add_handler(CallbackQueryHandler(button_router))
+    app.add_handler(InlineQueryHandler(inline_query_handler))
+    app.add_handler(ChatMemberHandler(track_channel_membership, ChatMemberHandler.CHAT_MEMBER))
 
     # تفعيل JobQueue
     app.bot_data['job_queue'] = app.job_queue
+    app.job_queue.run_daily(reconcile_statistics_job, time=dt_time(hour=STATS_RECONCILE_HOUR))
+    app.job_queue.run_daily(repair_points_job, time=dt_time(hour=POINTS_REPAIR_HOUR))
+    app.job_queue.run_repeating(flush_join_tracker_job, interval=JOIN_FLUSH_SECONDS, first=JOIN_FLUSH_SECONDS)
+    app.job_queue.run_repeating(flush_processed_updates_job, interval=UPDATE_DEDUP_FLUSH_SECONDS, first=UPDATE_DEDUP_FLUSH_SECONDS)
+    app.job_queue.run_repeating(prune_processed_keys_job, interval=3600, first=3600)
+    app.job_queue.run_repeating(outbox_job, interval=OUTBOX_POLL_SECONDS, first=1)
+    if SWEEP_INTERVAL_MINUTES > 0:
+        app.job_queue.run_repeating(membership_sweep_job, interval=SWEEP_INTERVAL_MINUTES * 60, first=60)
+    app.job_queue.run_repeating(retention_job, interval=RETENTION_INTERVAL_MINUTES * 60, first=RETENTION_INTERVAL_MINUTES * 60)
+    backup_interval = config.BACKUP_INTERVAL_HOURS * 3600
+    app.job_queue.run_repeating(backup_job, interval=backup_interval, first=backup_interval)
+    return app
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    app = build_application()
 
-    app.run_polling(drop_pending_updates=True)
+    # chat_member لا تُرسل إلا إذا طُلبت صراحة (ويجب أن يكون البوت مشرفًا في القناة)
+    app.run_polling(drop_pending_updates=DROP_PENDING_UPDATES, allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     main()
@@ -16,7 +16,110 @@ CHANNEL_USERNAME = os.getenv("CHANNEL_USERNAME") or "SignalXProOfficial1"
 # اسم البوت بدون @
 BOT_USERNAME = os.getenv("BOT_USERNAME") or "GoldenDen_OfficialBot"
 
+# مسار قاعدة البيانات
+DB_PATH = os.getenv("DB_PATH") or "contest.db"
+
 # إعدادات النظام
 POINTS_PER_REFERRAL = int(os.getenv("POINTS_PER_REFERRAL", "5"))
 MAX_JOIN_ATTEMPTS = int(os.getenv("MAX_JOIN_ATTEMPTS", "2"))
 
+# تتبع الانضمام/المغادرة: طول النافذة المنزلقة بالثواني، عدد الأحداث المحفوظة لكل مستخدم،
+# أقصى عدد مستخدمين في الذاكرة، وفترة الحفظ في قاعدة البيانات
+JOIN_WINDOW_SECONDS = int(os.getenv("JOIN_WINDOW_SECONDS", "86400"))
+JOIN_EVENT_BUFFER = int(os.getenv("JOIN_EVENT_BUFFER", "16"))
+JOIN_TRACKER_MAX_USERS = int(os.getenv("JOIN_TRACKER_MAX_USERS", "100000"))
+JOIN_FLUSH_SECONDS = int(os.getenv("JOIN_FLUSH_SECONDS", "60"))
+
+# ساعة المطابقة الليلية لعدّادات الإحصائيات (0-23)
+STATS_RECONCILE_HOUR = int(os.getenv("STATS_RECONCILE_HOUR", "3"))
+
+# ساعة إعادة حساب النقاط وإصلاح الانحراف (0-23)، وعدد المستخدمين في كل معاملة إصلاح
+POINTS_REPAIR_HOUR = int(os.getenv("POINTS_REPAIR_HOUR", "4"))
+POINTS_REPAIR_CHUNK = int(os.getenv("POINTS_REPAIR_CHUNK", "2000"))
+
+# حجم الدفعة في العمليات الجماعية (حظر/رفع حظر/استيراد من ملف)
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "20000"))
+
+# منع التكرار: عند عدم إسقاط التحديثات المعلّقة يحمي فهرس التحديثات المعالجة من تكرار الإجراءات.
+# Telegram يحتفظ بالتحديثات 24 ساعة، لذا تكفي نافذة بهذا الطول
+DROP_PENDING_UPDATES = (os.getenv("DROP_PENDING_UPDATES") or "0") == "1"
+UPDATE_DEDUP_MEMORY = int(os.getenv("UPDATE_DEDUP_MEMORY", "100000"))
+UPDATE_DEDUP_FLUSH_SECONDS = int(os.getenv("UPDATE_DEDUP_FLUSH_SECONDS", "5"))
+IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "86400"))
+
+# الفحص الدوري للعضوية: الفترة بالدقائق (0 = معطّل)، حجم الدفعة، عدد الدفعات في كل تشغيل،
+# أقصى طلبات متزامنة، وأقصى عدد طلبات get_chat_member في الثانية
+SWEEP_INTERVAL_MINUTES = int(os.getenv("SWEEP_INTERVAL_MINUTES", "10"))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "200"))
+SWEEP_BATCHES_PER_RUN = int(os.getenv("SWEEP_BATCHES_PER_RUN", "10"))
+SWEEP_CONCURRENCY = int(os.getenv("SWEEP_CONCURRENCY", "5"))
+SWEEP_RATE_PER_SECOND = float(os.getenv("SWEEP_RATE_PER_SECOND", "10"))
+
+# الاحتفاظ بالبيانات: عمر سجلات الغش والمسابقات المنتهية/الملغاة (بالأيام) قبل نقلها للأرشيف،
+# وعمر التجميعات الساعية. تعمل المهمة كل RETENTION_INTERVAL_MINUTES فقط بعد RETENTION_IDLE_SECONDS
+# بلا تحديثات، ولمدة لا تتجاوز RETENTION_BUDGET_SECONDS
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR") or "archive"
+RETENTION_CHEAT_LOG_DAYS = int(os.getenv("RETENTION_CHEAT_LOG_DAYS", "90"))
+RETENTION_CONTEST_DAYS = int(os.getenv("RETENTION_CONTEST_DAYS", "365"))
+RETENTION_HOURLY_ROLLUP_DAYS = int(os.getenv("RETENTION_HOURLY_ROLLUP_DAYS", "90"))
+RETENTION_CHUNK = int(os.getenv("RETENTION_CHUNK", "1000"))
+VACUUM_PAGES_PER_STEP = int(os.getenv("VACUUM_PAGES_PER_STEP", "200"))
+RETENTION_INTERVAL_MINUTES = int(os.getenv("RETENTION_INTERVAL_MINUTES", "5"))
+RETENTION_IDLE_SECONDS = int(os.getenv("RETENTION_IDLE_SECONDS", "30"))
+RETENTION_BUDGET_SECONDS = int(os.getenv("RETENTION_BUDGET_SECONDS", "20"))
+
+# النسخ الاحتياطي: المجلد، عدد النسخ المحفوظة (0 = الاحتفاظ بالكل)، الفترة بالساعات، وعدد الصفحات في كل خطوة
+BACKUP_DIR = os.getenv("BACKUP_DIR") or "backups"
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "6"))
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+
+# مدة جلسة التشخيص (تحليل الأداء/الذاكرة) بالثواني
+PROFILE_SECONDS = int(os.getenv("PROFILE_SECONDS", "30"))
+
+# تسجيل التحديثات لإعادة تشغيلها (replay.py): المجلد (فارغ = معطّل)، حجم الملف قبل التدوير،
+# ومفتاح إخفاء المعرفات (افتراضيًا التوكن)
+RECORD_UPDATES_DIR = os.getenv("RECORD_UPDATES_DIR") or ""
+RECORD_MAX_BYTES = int(os.getenv("RECORD_MAX_BYTES", str(64 * 1024 * 1024)))
+RECORD_SCRUB_KEY = os.getenv("RECORD_SCRUB_KEY") or ""
+
+# عدد المسابقات في كل صفحة من قوائم المسابقات
+CONTEST_PAGE_SIZE = int(os.getenv("CONTEST_PAGE_SIZE", "5"))
+
+# شريحة "تحققوا حديثًا" في البث الموجّه: عدد الأيام
+RECENT_VERIFIED_DAYS = int(os.getenv("RECENT_VERIFIED_DAYS", "7"))
+
+# الوضع المضمّن (@البوت في أي محادثة؛ يُفعّل من BotFather عبر /setinline): مدة تخزين النتائج
+# بالثواني (تُرسل أيضًا كـ cache_time لتيليجرام)، وعدد المتصدرين في بطاقة الترتيب
+INLINE_CACHE_SECONDS = int(os.getenv("INLINE_CACHE_SECONDS", "30"))
+INLINE_TOP_COUNT = int(os.getenv("INLINE_TOP_COUNT", "10"))
+# عدد المستخدمين الذين تُحفظ نتائجهم المضمّنة في الذاكرة
+INLINE_CACHE_USERS = int(os.getenv("INLINE_CACHE_USERS", "10000"))
+
+# لوحة الصدارة العامة: حجم الصفحة، أقصى عدد صفحات، ومدة التخزين المؤقت بالثواني
+LEADERBOARD_PAGE_SIZE = int(os.getenv("LEADERBOARD_PAGE_SIZE", "10"))
+LEADERBOARD_MAX_PAGES = int(os.getenv("LEADERBOARD_MAX_PAGES", "10"))
+LEADERBOARD_CACHE_SECONDS = float(os.getenv("LEADERBOARD_CACHE_SECONDS", "5"))
+
+# صندوق الإشعارات الصادرة: حجم الدفعة، فترة الفحص بالثواني، وأقصى عدد محاولات للإشعار الواحد
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+
+# تجميع إشعارات الإحالة للمُحيلين النشطين في رسالة واحدة: أقصر وأطول نافذة تجميع بالثواني.
+# النافذة تتضاعف ما دامت الإحالات متلاحقة وتنكمش حتى الإرسال الفوري عند الهدوء
+REFERRAL_DIGEST_MIN_SECONDS = int(os.getenv("REFERRAL_DIGEST_MIN_SECONDS", "30"))
+REFERRAL_DIGEST_MAX_SECONDS = int(os.getenv("REFERRAL_DIGEST_MAX_SECONDS", "600"))
+# عدد المُحيلين الذين تُحفظ نوافذ تجميعهم في الذاكرة (الأقدم يعود للإرسال الفوري)
+REFERRAL_DIGEST_TRACKED = int(os.getenv("REFERRAL_DIGEST_TRACKED", "10000"))
+
+# ملف JSON لتشغيل عدة بوتات/قنوات في عملية واحدة (tenants.py)؛ فارغ = بوت واحد من الإعدادات أعلاه
+TENANTS_FILE = os.getenv("TENANTS_FILE") or ""
+# حجم مجمع اتصالات HTTP المشترك بين البوتات، وملف عدّادات التشغيل لكل بوت وفترة تحديثه بالثواني
+TENANTS_HTTP_POOL_SIZE = int(os.getenv("TENANTS_HTTP_POOL_SIZE", "64"))
+TENANTS_METRICS_FILE = os.getenv("TENANTS_METRICS_FILE") or "tenants_metrics.json"
+TENANTS_METRICS_SECONDS = float(os.getenv("TENANTS_METRICS_SECONDS", "30"))
+
+# لوحة التحكم المحلية (للقراءة فقط) — dashboard.py
+DASHBOARD_HOST = os.getenv("DASHBOARD_HOST") or "127.0.0.1"
+DASHBOARD_PORT = int(os.getenv("DASHBOARD_PORT", "8080"))
@@ -0,0 +1,93 @@
+# dashboard.py
+# لوحة تحكم محلية للقراءة فقط — تقرأ من جدول stats_rollups وحده
+import sqlite3
+import json
+import html
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import config
+
+METRICS = {
+    'joins': "👥 الانضمامات",
+    'verifications': "✅ التحققات",
+    'referrals': "🔗 الإحالات المحتسبة",
+    'bans': "🚫 الحظر",
+    'cheats': "🕵️ حالات الغش",
+}
+RANGES = {'hour': (timedelta(hours=48), '%Y-%m-%d %H:00'), 'day': (timedelta(days=180), '%Y-%m-%d')}
+
+def open_readonly():
+    return sqlite3.connect(f"file:{config.DB_PATH}?mode=ro", uri=True)
+
+def get_series(conn, granularity):
+    span, fmt = RANGES[granularity]
+    since = (datetime.now() - span).strftime(fmt)
+    c = conn.cursor()
+    c.execute("""SELECT bucket, metric, value FROM stats_rollups
+                 WHERE granularity = ? AND bucket >= ? ORDER BY bucket""", (granularity, since))
+    series = {m: [] for m in METRICS}
+    for bucket, metric, value in c.fetchall():
+        if metric in series:
+            series[metric].append((bucket, value))
+    return series
+
+def render_chart(points, width=720, height=120):
+    if not points:
+        return "<p>لا توجد بيانات.</p>"
+    peak = max(v for _, v in points) or 1
+    bar_w = width / len(points)
+    bars = "".join(
+        f'<rect x="{i * bar_w:.1f}" y="{height - v / peak * height:.1f}" width="{max(bar_w - 1, 1):.1f}" '
+        f'height="{v / peak * height:.1f}"><title>{html.escape(b)}: {v}</title></rect>'
+        for i, (b, v) in enumerate(points)
+    )
+    return f'<svg width="{width}" height="{height}" fill="#d4a017">{bars}</svg>'
+
+def render_page(series, granularity):
+    sections = "".join(
+        f"<h3>{label} — المجموع: {sum(v for _, v in series[m])}</h3>{render_chart(series[m])}"
+        for m, label in METRICS.items()
+    )
+    other = 'day' if granularity == 'hour' else 'hour'
+    return (
+        '<!doctype html><html dir="rtl"><head><meta charset="utf-8"><title>لوحة المسابقات</title></head>'
+        f'<body style="font-family:sans-serif"><h2>📊 لوحة المسابقات ({granularity})</h2>'
+        f'<a href="/?g={other}">عرض {other}</a>{sections}</body></html>'
+    )
+
+# كل طلب يُخدم في خيط مستقل (ThreadingHTTPServer)، فيفتح اتصال قراءة خاصًا به
+class DashboardHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        granularity = parse_qs(url.query).get('g', ['hour'])[0]
+        if granularity not in RANGES:
+            granularity = 'hour'
+        conn = open_readonly()
+        try:
+            series = get_series(conn, granularity)
+        finally:
+            conn.close()
+        if url.path == '/api/rollups':
+            body, ctype = json.dumps(series, ensure_ascii=False).encode(), 'application/json'
+        elif url.path == '/':
+            body, ctype = render_page(series, granularity).encode(), 'text/html; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    server = ThreadingHTTPServer((config.DASHBOARD_HOST, config.DASHBOARD_PORT), DashboardHandler)
+    print(f"Dashboard: http://{config.DASHBOARD_HOST}:{config.DASHBOARD_PORT}/")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
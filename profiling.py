@@ -0,0 +1,83 @@
+# profiling.py
+# جلسات تشخيص عند الطلب: cProfile لمدة محددة وتتبع الذاكرة عبر tracemalloc.
+# عند عدم وجود جلسة نشطة لا يوجد أي تغليف أو قياس (active() تعيد None فقط).
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+
+_session = None
+
+class ProfilingSession:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started = time.perf_counter()
+        self.profiler = cProfile.Profile()
+        # مفتاح الزر -> [عدد مرات الاستدعاء، إجمالي الزمن، أقصى زمن]
+        self.handler_times = defaultdict(lambda: [0, 0.0, 0.0])
+        self.profiler.enable()
+
+    def record(self, key, elapsed):
+        stats = self.handler_times[key]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    def report(self, limit=60):
+        self.profiler.disable()
+        out = io.StringIO()
+        duration = time.perf_counter() - self.started
+        out.write(f"Profiling window: {duration:.1f}s (requested {self.seconds}s)\n\n")
+        out.write(f"{'handler':<32}{'calls':>8}{'total ms':>12}{'mean ms':>10}{'max ms':>10}\n")
+        for key, (calls, total, peak) in sorted(self.handler_times.items(), key=lambda kv: -kv[1][1]):
+            out.write(f"{key[:31]:<32}{calls:>8}{total * 1000:>12.1f}{total / calls * 1000:>10.2f}{peak * 1000:>10.2f}\n")
+        out.write("\n")
+        pstats.Stats(self.profiler, stream=out).strip_dirs().sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+def active():
+    return _session
+
+def start_cpu_profile(seconds):
+    global _session
+    if _session is not None:
+        return False
+    _session = ProfilingSession(seconds)
+    return True
+
+def stop_cpu_profile():
+    global _session
+    session, _session = _session, None
+    return session.report() if session else None
+
+# مفتاح التجميع في التقرير: callback_data بدون المعرفات الرقمية في آخرها
+def handler_key(data):
+    return data.rstrip("0123456789_") or data
+
+def start_memory_trace(frames=10):
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    return True
+
+def stop_memory_trace(limit=40):
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    out = io.StringIO()
+    out.write(f"Traced memory: current={current / 1024:.1f} KiB peak={peak / 1024:.1f} KiB\n\n")
+    out.write("Top allocations by line:\n")
+    for i, stat in enumerate(snapshot.statistics("lineno")[:limit], 1):
+        out.write(f"{i:>3}. {stat}\n")
+    out.write("\nTop allocations by traceback:\n")
+    for stat in snapshot.statistics("traceback")[:5]:
+        out.write(f"\n{stat.count} blocks, {stat.size / 1024:.1f} KiB\n")
+        out.write("\n".join(stat.traceback.format()) + "\n")
+    return out.getvalue()
@@ -0,0 +1,86 @@
+# recorder.py
+# تسجيل التحديثات الواردة (بعد إخفاء البيانات الشخصية) في ملفات JSONL دوّارة لإعادة تشغيلها لاحقًا
+import hashlib
+import hmac
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+ID_BITS = 52
+PUBLIC_CHAT_TYPES = ('channel', 'supergroup', 'group')
+NAME_KEYS = ('first_name', 'last_name', 'title', 'file_name', 'bio')
+START_RE = re.compile(r"^(/start(?:@\w+)?\s+)(\d+)$")
+
+# تحويل ثابت (HMAC) لمعرفات المستخدمين: يحافظ على العلاقات (المُحيل/المُحال) دون كشف المعرف الحقيقي
+def scrub_id(value, key):
+    if value is None:
+        return None
+    digest = hmac.new(key.encode(), str(int(value)).encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], 'big') >> (64 - ID_BITS) or 1
+
+def scrub_text(text, key):
+    if text.startswith('/'):
+        m = START_RE.match(text)
+        return f"{m.group(1)}{scrub_id(m.group(2), key)}" if m else text.split()[0]
+    # المدخلات الرقمية (مدد، أعداد فائزين) تؤثر في مسار المعالجة فتبقى كما هي
+    if text.strip().isdigit():
+        return text
+    return "x" * len(text)
+
+def scrub(obj, key):
+    if isinstance(obj, list):
+        return [scrub(v, key) for v in obj]
+    if not isinstance(obj, dict):
+        return obj
+    public = obj.get('type') in PUBLIC_CHAT_TYPES
+    out = {}
+    for k, v in obj.items():
+        if public:
+            out[k] = v
+        elif k == 'id' and isinstance(v, int) and not obj.get('is_bot'):
+            out[k] = scrub_id(v, key)
+        elif k == 'username' and isinstance(v, str) and not obj.get('is_bot'):
+            out[k] = "user" + hmac.new(key.encode(), v.encode(), hashlib.sha256).hexdigest()[:10]
+        elif k in NAME_KEYS and isinstance(v, str):
+            out[k] = "User"
+        elif k in ('text', 'caption', 'query') and isinstance(v, str):
+            out[k] = scrub_text(v, key)
+        elif k in ('phone_number', 'email', 'invite_link', 'photo', 'contact', 'location'):
+            continue
+        else:
+            out[k] = scrub(v, key)
+    return out
+
+class RecordWriter:
+    def __init__(self, directory, max_bytes, key):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.key = key
+        self.file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _rotate(self):
+        if self.file:
+            self.file.close()
+        name = f"updates_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jsonl"
+        self.file = open(os.path.join(self.directory, name), 'a', encoding='utf-8')
+
+    def write(self, update_dict):
+        if self.file is None or self.file.tell() >= self.max_bytes:
+            self._rotate()
+        line = json.dumps({'t': time.time(), 'update': scrub(update_dict, self.key)}, ensure_ascii=False)
+        self.file.write(line + "\n")
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+def iter_records(paths):
+    for path in sorted(paths):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
@@ -0,0 +1,240 @@
+# replay.py
+# إعادة تشغيل التحديثات المسجلة (recorder.py) على نسخة من قاعدة البيانات وخادم Bot API وهمي محلي،
+# لقياس زمن الاستجابة والإنتاجية ومقارنة نسختين من الكود.
+#
+#   python replay.py run --code . --db contest.db --records recordings/ --speed 10 --out new.json
+#   python replay.py run --code ../old_checkout --db contest.db --records recordings/ --out old.json
+#   python replay.py diff old.json new.json
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+import recorder
+
+REPLAY_TOKEN = "123456:replay"
+FAKE_BOT = {"id": 123456, "is_bot": True, "first_name": "Replay", "username": "replay_bot",
+            "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": True}
+
+# === خادم Bot API وهمي ===
+class FakeBotAPI(BaseHTTPRequestHandler):
+    latency = 0.0
+    calls = defaultdict(int)
+    message_id = 0
+    lock = threading.Lock()
+
+    def _params(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b""
+        ctype = self.headers.get('Content-Type', '')
+        if 'json' in ctype:
+            return json.loads(body or b"{}")
+        if 'urlencoded' in ctype:
+            return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        return {}
+
+    def _message(self, params):
+        with self.lock:
+            FakeBotAPI.message_id += 1
+            message_id = FakeBotAPI.message_id
+        chat_id = int(params.get('chat_id') or 0)
+        return {"message_id": message_id, "date": int(time.time()), "from": FAKE_BOT,
+                "chat": {"id": chat_id, "type": "private"}, "text": params.get('text', '')}
+
+    def _result(self, method, params):
+        if method == 'getMe':
+            return FAKE_BOT
+        if method in ('sendMessage', 'editMessageText', 'sendDocument', 'editMessageReplyMarkup'):
+            return self._message(params)
+        if method == 'getChatMember':
+            user_id = int(params.get('user_id') or 0)
+            return {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": "User"}}
+        if method == 'getFile':
+            return {"file_id": params.get('file_id', ''), "file_unique_id": "replay", "file_size": 0}
+        return True
+
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        params = self._params()
+        with self.lock:
+            FakeBotAPI.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps({"ok": True, "result": self._result(method, params)}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_api(latency):
+    FakeBotAPI.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# === تجهيز نسخة قاعدة البيانات ===
+# تُنسخ القاعدة ثم تُستبدل المعرفات بنفس التحويل المستخدم في التسجيل حتى تتطابق مع التحديثات
+def prepare_database(src_path, workdir, key):
+    dst_path = os.path.join(workdir, "contest.db")
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True)
+    dst = sqlite3.connect(dst_path)
+    src.backup(dst)
+    src.close()
+    dst.create_function("scrub_id", 1, lambda v: recorder.scrub_id(v, key), deterministic=True)
+    statements = (
+        "UPDATE users SET user_id = scrub_id(user_id), referred_by = scrub_id(referred_by)",
+        "UPDATE cheat_logs SET cheater1_id = scrub_id(cheater1_id), cheater2_id = scrub_id(cheater2_id)",
+        "UPDATE join_tracker SET user_id = scrub_id(user_id)",
+        "DELETE FROM processed_updates",
+    )
+    for sql in statements:
+        try:
+            dst.execute(sql)
+        except sqlite3.OperationalError:
+            pass
+    dst.commit()
+    dst.close()
+    return dst_path
+
+def update_kind(update):
+    if 'callback_query' in update:
+        data = update['callback_query'].get('data') or ''
+        return "cb:" + (data.rstrip("0123456789_") or data)
+    message = update.get('message')
+    if message:
+        text = message.get('text') or ''
+        return "cmd:" + text.split()[0] if text.startswith('/') else "message"
+    return next((k for k in update if k != 'update_id'), 'unknown')
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+# === التشغيل ===
+async def replay(app, records, speed):
+    from telegram import Update
+    latencies = defaultdict(list)
+    service = defaultdict(list)
+    await app.initialize()
+    wall_start = time.perf_counter()
+    first_t = records[0]['t'] if records else 0
+    try:
+        for rec in records:
+            # وقت الوصول الافتراضي؛ المعالجة تسلسلية كما في run_polling فيُحتسب زمن الانتظار أيضًا
+            arrival = wall_start + ((rec['t'] - first_t) / speed if speed > 0 else 0)
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind = update_kind(rec['update'])
+            t0 = time.perf_counter()
+            await app.process_update(Update.de_json(rec['update'], app.bot))
+            t1 = time.perf_counter()
+            service[kind].append(t1 - t0)
+            latencies[kind].append(t1 - (arrival if speed > 0 else t0))
+    finally:
+        await app.shutdown()
+    return latencies, service, time.perf_counter() - wall_start
+
+def run(args):
+    key = os.getenv("RECORD_SCRUB_KEY") or os.getenv("BOT_TOKEN") or ""
+    if not key:
+        sys.exit("RECORD_SCRUB_KEY (أو BOT_TOKEN) مطلوب لمطابقة المعرفات المسجلة")
+    paths = glob.glob(os.path.join(args.records, "*.jsonl")) if os.path.isdir(args.records) else [args.records]
+    records = sorted(recorder.iter_records(paths), key=lambda r: r['t'])
+    if args.limit:
+        records = records[:args.limit]
+
+    workdir = tempfile.mkdtemp(prefix="replay_")
+    db_path = prepare_database(args.db, workdir, key)
+    admin_ids = [int(x) for x in (os.getenv("ADMIN_IDS") or "").split(",") if x.strip().isdigit()]
+    os.environ.update({
+        "DB_PATH": db_path,
+        "BACKUP_DIR": os.path.join(workdir, "backups"),
+        "RECORD_UPDATES_DIR": "",
+        "ADMIN_IDS": ",".join(str(recorder.scrub_id(a, key)) for a in admin_ids),
+    })
+    server = start_fake_api(args.api_latency_ms / 1000)
+
+    sys.path.insert(0, os.path.abspath(args.code))
+    os.chdir(workdir)
+    import bot
+    if not hasattr(bot, "build_application"):
+        sys.exit("نسخة الكود لا تحتوي build_application ولا يمكن إعادة التشغيل عليها")
+    app = bot.build_application(REPLAY_TOKEN, base_url=f"http://127.0.0.1:{server.server_port}/bot")
+    latencies, service, wall = asyncio.run(replay(app, records, args.speed))
+    server.shutdown()
+
+    result = {
+        "code": os.path.abspath(args.code),
+        "updates": len(records),
+        "wall_seconds": wall,
+        "throughput": len(records) / wall if wall else 0.0,
+        "api_calls": dict(FakeBotAPI.calls),
+        "latency": dict(latencies),
+        "service": dict(service),
+    }
+    with open(args.out, 'w') as f:
+        json.dump(result, f)
+    print(f"{len(records)} updates in {wall:.2f}s ({result['throughput']:.1f}/s), "
+          f"{sum(FakeBotAPI.calls.values())} API calls -> {args.out}")
+
+def diff(args):
+    with open(args.a) as f:
+        a = json.load(f)
+    with open(args.b) as f:
+        b = json.load(f)
+
+    def pct(old, new):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"throughput: {a['throughput']:.1f}/s -> {b['throughput']:.1f}/s ({pct(a['throughput'], b['throughput'])})")
+    print(f"api calls:  {sum(a['api_calls'].values())} -> {sum(b['api_calls'].values())}")
+    print()
+    print(f"{'kind':<32}{'n':>7}{'p50 A':>10}{'p50 B':>10}{'Δp50':>9}{'p99 A':>10}{'p99 B':>10}{'Δp99':>9}")
+    for kind in sorted(set(a['latency']) | set(b['latency'])):
+        la, lb = a['latency'].get(kind, []), b['latency'].get(kind, [])
+        a50, b50 = percentile(la, 0.5) * 1000, percentile(lb, 0.5) * 1000
+        a99, b99 = percentile(la, 0.99) * 1000, percentile(lb, 0.99) * 1000
+        print(f"{kind[:31]:<32}{max(len(la), len(lb)):>7}{a50:>10.2f}{b50:>10.2f}{pct(a50, b50):>9}"
+              f"{a99:>10.2f}{b99:>10.2f}{pct(a99, b99):>9}")
+    all_a = [v for vs in a['latency'].values() for v in vs]
+    all_b = [v for vs in b['latency'].values() for v in vs]
+    if all_a and all_b:
+        print(f"{'ALL':<32}{len(all_a):>7}{percentile(all_a, 0.5) * 1000:>10.2f}{percentile(all_b, 0.5) * 1000:>10.2f}"
+              f"{pct(statistics.median(all_a), statistics.median(all_b)):>9}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("run")
+    p.add_argument("--code", default=".", help="مجلد نسخة الكود (يحتوي bot.py)")
+    p.add_argument("--db", default="contest.db")
+    p.add_argument("--records", default="recordings")
+    p.add_argument("--speed", type=float, default=1.0, help="1 = السرعة الأصلية، 0 = بأقصى سرعة")
+    p.add_argument("--api-latency-ms", type=float, default=0.0)
+    p.add_argument("--limit", type=int, default=0)
+    p.add_argument("--out", default="replay_result.json")
+    p = sub.add_parser("diff")
+    p.add_argument("a")
+    p.add_argument("b")
+    args = parser.parse_args()
+    run(args) if args.cmd == "run" else diff(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# retention.py
+# الاحتفاظ بالبيانات: نقل سجلات الغش والمسابقات القديمة إلى أرشيف مضغوط (JSONL.gz)،
+# وتقليص الملف تدريجيًا عبر incremental_vacuum حتى تبقى الجداول الساخنة صغيرة.
+#
+#   python retention.py enable-incremental-vacuum   تحويل قاعدة قائمة (VACUUM كامل، أوقف البوت أولاً)
+#   python retention.py run                         تنفيذ دورة أرشفة كاملة يدويًا
+import sqlite3
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+import config
+
+# الجدول -> (شرط القِدم، عمود التاريخ، شرط إضافي)
+ARCHIVE_TABLES = {
+    'cheat_logs': ("detected_at < ?", "detected_at", ""),
+    'contests': ("end_time < ?", "end_time", "AND status IN ('finished', 'cancelled')"),
+}
+
+def cutoffs(now=None):
+    now = now or datetime.now()
+    return {
+        'cheat_logs': (now - timedelta(days=config.RETENTION_CHEAT_LOG_DAYS)).isoformat(),
+        'contests': (now - timedelta(days=config.RETENTION_CONTEST_DAYS)).strftime("%Y-%m-%d %H:%M"),
+    }
+
+def open_connection(db_path=config.DB_PATH):
+    # تُستخدم من خيط خلفي (asyncio.to_thread)
+    return sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+
+# ملف أرشيف لكل جدول وشهر؛ gzip يسمح بالإلحاق كأعضاء متتالية
+def archive_path(table, stamp, archive_dir=config.ARCHIVE_DIR):
+    return os.path.join(archive_dir, f"{table}_{stamp[:7].replace('-', '')}.jsonl.gz")
+
+# ينقل دفعة واحدة من الصفوف الأقدم من الحد. الكتابة إلى الأرشيف تسبق الحذف، فالانقطاع بينهما
+# قد يكرر صفوفًا في الأرشيف لكنه لا يفقد شيئًا. يعيد عدد الصفوف المنقولة.
+def archive_chunk(conn, table, cutoff, chunk_size=config.RETENTION_CHUNK, archive_dir=config.ARCHIVE_DIR):
+    where, date_col, extra = ARCHIVE_TABLES[table]
+    c = conn.cursor()
+    c.execute(f"SELECT * FROM {table} WHERE {where} {extra} ORDER BY {date_col} LIMIT ?", (cutoff, chunk_size))
+    rows = c.fetchall()
+    if not rows:
+        return 0
+    columns = [d[0] for d in c.description]
+    date_idx = columns.index(date_col)
+    os.makedirs(archive_dir, exist_ok=True)
+    by_file = {}
+    for r in rows:
+        by_file.setdefault(archive_path(table, r[date_idx] or "0000-00", archive_dir), []).append(r)
+    for path, file_rows in by_file.items():
+        with gzip.open(path, 'at', encoding='utf-8') as f:
+            f.writelines(json.dumps(dict(zip(columns, r)), ensure_ascii=False) + "\n" for r in file_rows)
+            f.flush()
+            os.fsync(f.fileno())
+    with conn:
+        c.executemany(f"DELETE FROM {table} WHERE id = ?", [(r[0],) for r in rows])
+        if table == 'contests':
+            # عدد المسابقات في الإحصائيات يشمل المؤرشفة
+            c.execute("""INSERT INTO stats_counters (name, value) VALUES ('archived_contests', ?)
+                         ON CONFLICT (name) DO UPDATE SET value = value + excluded.value""", (len(rows),))
+    return len(rows)
+
+def prune_hourly_rollups(conn, days=config.RETENTION_HOURLY_ROLLUP_DAYS):
+    cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:00')
+    with conn:
+        c = conn.execute("DELETE FROM stats_rollups WHERE granularity = 'hour' AND bucket < ?", (cutoff,))
+    return c.rowcount
+
+# يعيد عدد الصفحات المحررة (0 إن لم يكن auto_vacuum=INCREMENTAL مفعّلًا أو لا توجد صفحات فارغة)
+def vacuum_step(conn, pages=config.VACUUM_PAGES_PER_STEP):
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if not free_before:
+        return 0
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return free_before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+# خطوة صغيرة واحدة: دفعة أرشفة لكل جدول ثم خطوة vacuum. يعيد ما تم لمعرفة هل بقي عمل
+def retention_step(conn, now=None, archive_dir=config.ARCHIVE_DIR):
+    done = {table: archive_chunk(conn, table, cutoff, archive_dir=archive_dir) for table, cutoff in cutoffs(now).items()}
+    done['vacuumed_pages'] = vacuum_step(conn)
+    return done
+
+def enable_incremental_vacuum(db_path=config.DB_PATH):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    finally:
+        conn.close()
+
+def main(argv):
+    if argv[:1] == ["enable-incremental-vacuum"]:
+        print("auto_vacuum =", enable_incremental_vacuum())
+    elif argv[:1] == ["run"]:
+        conn = open_connection()
+        total = {}
+        while True:
+            done = retention_step(conn)
+            for k, v in done.items():
+                total[k] = total.get(k, 0) + v
+            if not any(done.values()):
+                break
+        total['hourly_rollups'] = prune_hourly_rollups(conn)
+        conn.close()
+        print(total)
+    else:
+        print("usage: python retention.py enable-incremental-vacuum|run")
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
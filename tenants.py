@@ -0,0 +1,199 @@
+# tenants.py
+# تشغيل عدة بوتات (كل منها بقناته وأدمنه وقاعدة بياناته) في عملية واحدة وحلقة أحداث واحدة.
+# المشترك بين البوتات: العملية وحلقة الأحداث ومجمع اتصالات HTTP واحد لطلبات Bot API
+# (SharedRequest؛ getUpdates يبقى لكل بوت لأنه طلب طويل مفتوح دائمًا).
+# كل مستأجر يحصل على نسخة مستقلة من bot.py بإعداداته الخاصة، فقاعدة البيانات (ملف واتصال كتابة
+# لكل بوت) والتخزين المؤقت وحدود الإرسال (SWEEP_RATE_PER_SECOND وغيرها) منفصلة ولا تُشترك:
+# بيانات البوتات في ملفات مختلفة وكل ملف SQLite له كاتب واحد.
+# عدّادات التشغيل لكل بوت (runtime_counters) تُكتب دوريًا في TENANTS_METRICS_FILE ويعرضها status.
+#
+# TENANTS_FILE ملف JSON بقائمة مستأجرين؛ كل مفتاح بأحرف كبيرة يستبدل الإعداد المماثل في config.py:
+#   [{"name": "gold", "BOT_TOKEN": "...", "CHANNEL_USERNAME": "GoldChannel", "BOT_USERNAME": "GoldBot",
+#     "ADMIN_IDS": [123], "ADMIN_USERNAME": "@gold_support"}, ...]
+# DB_PATH وARCHIVE_DIR وBACKUP_DIR وRECORD_UPDATES_DIR تُفصل تلقائيًا باسم المستأجر إن لم تُحدد.
+# مدد الأرشفة وخطوة vacuum تبقى مشتركة (تُقرأ من config.py).
+#
+#   python tenants.py run       تشغيل كل البوتات
+#   python tenants.py status    عدّادات كل مستأجر وعدد الإشعارات المنتظرة وآخر عدّادات التشغيل
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import signal
+import sqlite3
+import sys
+import time
+import types
+from telegram.request import BaseRequest, HTTPXRequest
+import config
+# وحدات تقرأ config عند الاستيراد؛ تُحمّل هنا بالإعدادات الأساسية قبل تبديل config لنسخ bot.py
+# (كل نسخة تمرر مساراتها صراحة: ARCHIVE_DIR وBACKUP_DIR وغيرها)
+import backup  # noqa: F401
+import retention  # noqa: F401
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+TENANT_NAME_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789_"
+
+def load_specs(path=config.TENANTS_FILE):
+    with open(path, encoding="utf-8") as f:
+        specs = json.load(f)
+    names = set()
+    for spec in specs:
+        name = spec.get("name", "")
+        if not name or set(name) - set(TENANT_NAME_CHARS) or name in names:
+            raise ValueError(f"اسم مستأجر غير صالح أو مكرر: {name!r}")
+        if not spec.get("BOT_TOKEN") or not spec.get("CHANNEL_USERNAME"):
+            raise ValueError(f"المستأجر {name} يحتاج BOT_TOKEN وCHANNEL_USERNAME")
+        names.add(name)
+    return specs
+
+# نسخة من config بإعدادات المستأجر، مع فصل المسارات حتى لا تختلط بيانات البوتات
+def tenant_config(spec):
+    name = spec["name"]
+    cfg = types.ModuleType(f"config_{name}")
+    for key in dir(config):
+        if key.isupper():
+            setattr(cfg, key, getattr(config, key))
+    cfg.DB_PATH = f"{name}.db"
+    cfg.ARCHIVE_DIR = os.path.join(config.ARCHIVE_DIR, name)
+    cfg.BACKUP_DIR = os.path.join(config.BACKUP_DIR, name)
+    if config.RECORD_UPDATES_DIR:
+        cfg.RECORD_UPDATES_DIR = os.path.join(config.RECORD_UPDATES_DIR, name)
+    for key, value in spec.items():
+        if key.isupper():
+            setattr(cfg, key, value)
+    cfg.TENANT_NAME = name
+    return cfg
+
+# يحمّل bot.py كوحدة مستقلة (bot_<name>) ترى config الخاص بالمستأجر عند الاستيراد
+def load_tenant(spec):
+    cfg = tenant_config(spec)
+    module_spec = importlib.util.spec_from_file_location(f"bot_{spec['name']}", BOT_PATH)
+    module = importlib.util.module_from_spec(module_spec)
+    saved = sys.modules["config"]
+    sys.modules["config"] = cfg
+    try:
+        module_spec.loader.exec_module(module)
+    finally:
+        sys.modules["config"] = saved
+    return module
+
+# عميل HTTP واحد لكل البوتات: كل Bot يستدعي initialize/shutdown مرة، فيُغلق المجمع مع آخر بوت فقط
+class SharedRequest(BaseRequest):
+    def __init__(self, inner):
+        self._inner = inner
+        self._users = 0
+
+    @property
+    def read_timeout(self):
+        return getattr(self._inner, "read_timeout", None)
+
+    async def initialize(self):
+        if self._users == 0:
+            await self._inner.initialize()
+        self._users += 1
+
+    async def shutdown(self):
+        if self._users == 0:
+            return
+        self._users -= 1
+        if self._users == 0:
+            await self._inner.shutdown()
+
+    async def do_request(self, *args, **kwargs):
+        return await self._inner.do_request(*args, **kwargs)
+
+def collect_metrics(modules):
+    return {module.config.TENANT_NAME: {'at': time.time(), **module.runtime_counters} for module in modules}
+
+def write_metrics(modules, path=config.TENANTS_METRICS_FILE):
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(collect_metrics(modules), f, ensure_ascii=False)
+    os.replace(path + ".part", path)
+
+async def metrics_loop(modules, interval=config.TENANTS_METRICS_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            write_metrics(modules)
+        except OSError as e:
+            logging.error(f"فشل حفظ عدّادات المستأجرين: {e}")
+
+async def run_tenants(modules):
+    apps = []
+    request = SharedRequest(HTTPXRequest(connection_pool_size=config.TENANTS_HTTP_POOL_SIZE))
+    metrics = None
+    try:
+        for module in modules:
+            app = module.build_application(request=request)
+            await app.initialize()
+            if app.post_init:
+                await app.post_init(app)
+            await app.updater.start_polling(drop_pending_updates=module.DROP_PENDING_UPDATES,
+                                            allowed_updates=module.Update.ALL_TYPES)
+            await app.start()
+            apps.append(app)
+            print(f"بدأ المستأجر {module.config.TENANT_NAME} (@{module.BOT_USERNAME})")
+        metrics = asyncio.create_task(metrics_loop(modules))
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+    finally:
+        if metrics:
+            metrics.cancel()
+            write_metrics(modules)
+        # نفس ترتيب run_polling: إيقاف الاستقبال ثم التطبيق ثم post_shutdown
+        for app in reversed(apps):
+            try:
+                await app.updater.stop()
+                await app.stop()
+                await app.shutdown()
+                if app.post_shutdown:
+                    await app.post_shutdown(app)
+            except Exception as e:
+                logging.error(f"فشل إيقاف مستأجر: {e}")
+
+def read_metrics(path=config.TENANTS_METRICS_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def tenant_status(spec, metrics=None):
+    cfg = tenant_config(spec)
+    if not os.path.exists(cfg.DB_PATH):
+        return None
+    conn = sqlite3.connect(f"file:{cfg.DB_PATH}?mode=ro", uri=True)
+    try:
+        stats = dict(conn.execute("SELECT name, value FROM stats_counters"))
+        stats['outbox_pending'] = conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+    finally:
+        conn.close()
+    if metrics and spec["name"] in metrics:
+        stats['runtime'] = metrics[spec["name"]]
+    return stats
+
+def main(argv):
+    if not config.TENANTS_FILE:
+        print("TENANTS_FILE غير محدد")
+        return 2
+    specs = load_specs()
+    if argv[:1] == ["run"]:
+        logging.basicConfig(level=logging.WARNING)
+        asyncio.run(run_tenants([load_tenant(spec) for spec in specs]))
+    elif argv[:1] == ["status"]:
+        metrics = read_metrics()
+        for spec in specs:
+            print(spec["name"], tenant_status(spec, metrics))
+    else:
+        print("usage: python tenants.py run|status")
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))